@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""
+@author: xi
+@since: 2018-09-22
+"""
+
+import argparse
+import functools
+import os
+
+import gym
+import numpy as np
+
+import photinia as ph
+from photinia.deep_rl import actors_critics
+from photinia.deep_rl import ddpg
+from photinia.deep_rl import distributed
+
+
+class Agent(ddpg.DDPGAgent):
+
+    def __init__(self, name, state_size, action_size, hidden_size=64):
+        super(Agent, self).__init__(
+            name,
+            ph.placeholder('source_state', (None, state_size)),
+            ph.placeholder('target_state', (None, state_size)),
+            ph.placeholder('reward', (None,)),
+            actors_critics.MLPActor('source_actor', state_size, action_size, hidden_size),
+            actors_critics.MLPActor('target_actor', state_size, action_size, hidden_size),
+            actors_critics.MLPCritic('source_critic', state_size, action_size, hidden_size * 2),
+            actors_critics.MLPCritic('target_critic', state_size, action_size, hidden_size * 2),
+            replay_size=100000
+        )
+
+
+def build_agent():
+    return Agent('agent', 3, 1)
+
+
+def report(stats):
+    rewards = stats['episode_rewards']
+    print('updates=%d env_steps=%d updates/s=%.1f env_steps/s=%.1f reward=%s' % (
+        stats['updates'],
+        stats['env_steps'],
+        stats['updates_per_sec'],
+        stats['env_steps_per_sec'],
+        '%.1f' % np.mean(rewards) if len(rewards) > 0 else '-'
+    ))
+
+
+def main(args):
+    model = build_agent()
+    ph.initialize_global_variables()
+    model.init()
+
+    env_fn = functools.partial(gym.make, 'Pendulum-v0')
+    actor_learner = distributed.ActorLearner(
+        model,
+        build_agent,
+        env_fn,
+        state_shape=(3,),
+        action_shape=(1,),
+        num_actors=args.num_actors,
+        num_envs=args.num_envs,
+        noise_stddev=[0.1 + 0.4 * i / max(args.num_actors - 1, 1) for i in range(args.num_actors)],
+        action_scale=2.0
+    )
+    with actor_learner:
+        actor_learner.run(args.num_updates, args.batch_size, callback=report, report_interval=1000)
+    return 0
+
+
+if __name__ == '__main__':
+    _parser = argparse.ArgumentParser()
+    _parser.add_argument('-g', '--gpu', default='0', help='Choose which GPU to use.')
+    _parser.add_argument('-b', '--batch-size', type=int, default=64)
+    _parser.add_argument('-n', '--num-updates', type=int, default=50000)
+    _parser.add_argument('--num-actors', type=int, default=4)
+    _parser.add_argument('--num-envs', type=int, default=2)
+    _args = _parser.parse_args()
+    os.environ['CUDA_VISIBLE_DEVICES'] = _args.gpu
+    exit(main(_args))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+"""
+@author: xi
+@since: 2018-09-20
+"""
+
+import argparse
+import functools
+import os
+
+import gym
+
+import photinia as ph
+from photinia import deep_rl
+from photinia.deep_rl import actors_critics
+from photinia.deep_rl import ddpg
+
+
+class Agent(ddpg.DDPGAgent):
+
+    def __init__(self, name, state_size, action_size, hidden_size=64):
+        super(Agent, self).__init__(
+            name,
+            ph.placeholder('source_state', (None, state_size)),
+            ph.placeholder('target_state', (None, state_size)),
+            ph.placeholder('reward', (None,)),
+            actors_critics.MLPActor('source_actor', state_size, action_size, hidden_size),
+            actors_critics.MLPActor('target_actor', state_size, action_size, hidden_size),
+            actors_critics.MLPCritic('source_critic', state_size, action_size, hidden_size * 2),
+            actors_critics.MLPCritic('target_critic', state_size, action_size, hidden_size * 2),
+            replay_size=100000
+        )
+
+
+def main(args):
+    model = Agent('agent', 3, 1)
+    ph.initialize_global_variables()
+    model.init()
+
+    env_fn = functools.partial(gym.make, 'Pendulum-v0')
+    env_noise = deep_rl.NormalNoise(0.5)
+    action_scale = env_fn().action_space.high
+    with deep_rl.EnvPool(env_fn, args.num_envs, args.num_workers) as env_pool:
+        env_pool.reset()
+        for i in range(args.num_loops):
+            #
+            # One predict call and one replay insert for all the environments.
+            model.explore(env_pool, env_noise, action_scale)
+            env_noise.discount(0.9999)
+            model.train(args.batch_size)
+
+            for total_r in env_pool.pop_episode_rewards():
+                print('[%d] %f' % (i, total_r))
+    return 0
+
+
+if __name__ == '__main__':
+    _parser = argparse.ArgumentParser()
+    _parser.add_argument('-g', '--gpu', default='0', help='Choose which GPU to use.')
+    _parser.add_argument('-b', '--batch-size', type=int, default=64)
+    _parser.add_argument('-n', '--num-loops', type=int, default=50000)
+    _parser.add_argument('--num-envs', type=int, default=8)
+    _parser.add_argument('--num-workers', type=int, default=4)
+    _args = _parser.parse_args()
+    os.environ['CUDA_VISIBLE_DEVICES'] = _args.gpu
+    exit(main(_args))
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+"""
+@author: xi
+@since: 2018-09-24
+
+Compare the per-step cost of the DDPG target network update:
+    legacy: one tf.assign per variable pair (paired by list order), run in its own session call.
+    fused: in-place grouped update run together with the actor step, optionally every N steps.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import photinia as ph
+from photinia.deep_rl import actors_critics
+from photinia.deep_rl import ddpg
+
+STATE_SIZE = 3
+ACTION_SIZE = 1
+
+
+class Agent(ddpg.DDPGAgent):
+
+    def __init__(self, name, actor_class, critic_class, hidden_size, num_layers, target_update_interval):
+        if num_layers is None:
+            actor_args = (STATE_SIZE, ACTION_SIZE, hidden_size)
+            critic_args = (STATE_SIZE, ACTION_SIZE, hidden_size * 2)
+        else:
+            actor_args = (STATE_SIZE, ACTION_SIZE, hidden_size, num_layers)
+            critic_args = (STATE_SIZE, ACTION_SIZE, hidden_size, num_layers)
+        self._legacy_update = None
+        super(Agent, self).__init__(
+            name,
+            ph.placeholder('source_state', (None, STATE_SIZE)),
+            ph.placeholder('target_state', (None, STATE_SIZE)),
+            ph.placeholder('reward', (None,)),
+            actor_class('source_actor', *actor_args),
+            actor_class('target_actor', *actor_args),
+            critic_class('source_critic', *critic_args),
+            critic_class('target_critic', *critic_args),
+            target_update_interval=target_update_interval
+        )
+
+    def _build(self):
+        super(Agent, self)._build()
+        #
+        # The update used before the fused one.
+        source_var_list = self._source_critic.get_trainable_variables() \
+                          + self._source_actor.get_trainable_variables()
+        target_var_list = self._target_critic.get_trainable_variables() \
+                          + self._target_actor.get_trainable_variables()
+        self._legacy_update = ph.Step(
+            updates=tf.group(*[
+                tf.assign(v_target, self._tao * v_source + (1.0 - self._tao) * v_target)
+                for v_source, v_target in zip(source_var_list, target_var_list)
+            ])
+        )
+
+    def train_legacy(self, batch_size):
+        state, action, reward, state_ = self._replay.get(batch_size)[:-1]
+        critic_loss, = self._step_train_critic(state, action, reward, state_)
+        actor_loss, = self._step_train_actor(state)
+        self._legacy_update()
+        return critic_loss, actor_loss
+
+
+def timeit(fn, num_steps):
+    for _ in range(10):
+        fn()
+    start = time.time()
+    for _ in range(num_steps):
+        fn()
+    return (time.time() - start) / num_steps * 1e3
+
+
+def main(args):
+    networks = [
+        ('mlp', actors_critics.MLPActor, actors_critics.MLPCritic, 64, None),
+        ('deep_res', actors_critics.DeepResActor, actors_critics.DeepResCritic, 64, 6)
+    ]
+    agents = []
+    for name, actor_class, critic_class, hidden_size, num_layers in networks:
+        for interval in (1, args.interval):
+            #
+            # The actor and critic widgets are built outside the agent, so each agent gets its own scope.
+            scope = '%s_%d' % (name, interval)
+            with tf.variable_scope(scope):
+                agent = Agent(
+                    'agent',
+                    actor_class, critic_class,
+                    hidden_size, num_layers,
+                    interval
+                )
+            agents.append((name, interval, agent))
+    ph.initialize_global_variables()
+
+    for name, interval, agent in agents:
+        agent.init()
+        for _ in range(args.batch_size * 4):
+            agent.feedback(
+                np.random.uniform(-1, 1, (STATE_SIZE,)),
+                np.random.uniform(-1, 1, (ACTION_SIZE,)),
+                np.random.uniform(-1, 1),
+                np.random.uniform(-1, 1, (STATE_SIZE,))
+            )
+
+    for name, interval, agent in agents:
+        if interval == 1:
+            print('[%s] legacy update: %.3f ms, fused update: %.3f ms' % (
+                name,
+                timeit(agent._legacy_update, args.num_steps),
+                timeit(agent.update_target, args.num_steps)
+            ))
+            print('[%s] train step with legacy update: %.3f ms' % (
+                name,
+                timeit(lambda: agent.train_legacy(args.batch_size), args.num_steps)
+            ))
+        print('[%s] train step with fused update every %d step(s): %.3f ms' % (
+            name,
+            interval,
+            timeit(lambda: agent.train(args.batch_size), args.num_steps)
+        ))
+    return 0
+
+
+if __name__ == '__main__':
+    _parser = argparse.ArgumentParser()
+    _parser.add_argument('-g', '--gpu', default='0', help='Choose which GPU to use.')
+    _parser.add_argument('-b', '--batch-size', type=int, default=64)
+    _parser.add_argument('-n', '--num-steps', type=int, default=1000)
+    _parser.add_argument('--interval', type=int, default=10)
+    _args = _parser.parse_args()
+    os.environ['CUDA_VISIBLE_DEVICES'] = _args.gpu
+    exit(main(_args))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""
+@author: xi
+@since: 2018-09-10
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import photinia as ph
+
+
+class Model(ph.Model):
+
+    def __init__(self, name, input_size, num_classes):
+        self._input_size = input_size
+        self._num_classes = num_classes
+        super(Model, self).__init__(name)
+
+    def _build(self):
+        x = ph.placeholder('x', (None, self._input_size))
+        y_ = ph.placeholder('y_', (None, self._num_classes))
+        keep_prob = ph.placeholder('keep_prob', ())
+        self._x = x
+        self._y_ = y_
+        self._keep_prob = keep_prob
+
+        lin = ph.Linear('lin', self._input_size, self._num_classes)
+        y = lin.setup(tf.nn.dropout(x, keep_prob))
+        loss = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(labels=y_, logits=y))
+        self._loss = loss
+        self._update = tf.train.GradientDescentOptimizer(0.1).minimize(loss)
+
+        self._add_slot(
+            'train',
+            inputs=(x, y_),
+            outputs={'loss': loss},
+            updates=self._update,
+            givens={keep_prob: 0.5}
+        )
+
+
+def bench(fn, num_loops):
+    fn()
+    start = time.time()
+    for _ in range(num_loops):
+        fn()
+    return (time.time() - start) / num_loops * 1e6
+
+
+def main(args):
+    model = Model('model', 10, 2)
+    ph.initialize_global_variables()
+    session = ph.get_session()
+
+    x = np.random.normal(size=(args.batch_size, 10)).astype(np.float32)
+    y_ = np.eye(2, dtype=np.float32)[np.random.randint(0, 2, args.batch_size)]
+
+    #
+    # The way Step ran before: rebuild "feed_dict" and resolve the nested fetches for each call.
+    feed_dict = {model._keep_prob: 0.5}
+    fetches = ({'loss': model._loss}, (model._update,))
+
+    def run_with_feed_dict():
+        feed_dict[model._x] = x
+        feed_dict[model._y_] = y_
+        return session.run(fetches=fetches, feed_dict=feed_dict)[0]
+
+    def run_with_step():
+        return model.train(x, y_)
+
+    t1 = bench(run_with_feed_dict, args.num_loops)
+    t2 = bench(run_with_step, args.num_loops)
+    print('session.run with feed_dict: %.1f us/call' % t1)
+    print('Step (callable from CallableOptions): %.1f us/call' % t2)
+    return 0
+
+
+if __name__ == '__main__':
+    _parser = argparse.ArgumentParser()
+    _parser.add_argument('-g', '--gpu', default='0', help='Choose which GPU to use.')
+    _parser.add_argument('-b', '--batch-size', type=int, default=8)
+    _parser.add_argument('-n', '--num-loops', type=int, default=10000)
+    _args = _parser.parse_args()
+    os.environ['CUDA_VISIBLE_DEVICES'] = _args.gpu
+    exit(main(_args))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+"""
+@author: xi
+@since: 2018-09-14
+"""
+
+import argparse
+import os
+import time
+
+import tensorflow as tf
+
+import photinia as ph
+
+
+class Model(ph.Model):
+
+    def __init__(self, name, size, num_widgets, num_layers):
+        self._size = size
+        self._num_widgets = num_widgets
+        self._num_layers = num_layers
+        super(Model, self).__init__(name)
+
+    def _build(self):
+        self._widgets = [
+            ph.ResidualLinear('res_%d' % i, self._size, self._num_layers)
+            for i in range(self._num_widgets)
+        ]
+        #
+        # Look up the variables of each widget while building, as regularizers and optimizers usually do.
+        self._var_list = [
+            var
+            for widget in self._widgets
+            for var in widget.get_trainable_variables()
+        ]
+
+
+def scan_trainable_variables(widget):
+    """The linear scan used before the variable index.
+    """
+    return [var for var in tf.trainable_variables() if var.name.startswith(widget.prefix)]
+
+
+def main(args):
+    start = time.time()
+    model = Model('model', args.size, args.num_widgets, args.num_layers)
+    print('%d variables built in %.3f s' % (len(tf.global_variables()), time.time() - start))
+
+    widgets = model._widgets
+    start = time.time()
+    for widget in widgets:
+        scan_trainable_variables(widget)
+    t1 = time.time() - start
+    start = time.time()
+    for widget in widgets:
+        widget.get_trainable_variables()
+    t2 = time.time() - start
+    print('Linear scan: %.3f ms/widget' % (t1 / len(widgets) * 1e3))
+    print('Variable index: %.3f ms/widget' % (t2 / len(widgets) * 1e3))
+    return 0
+
+
+if __name__ == '__main__':
+    _parser = argparse.ArgumentParser()
+    _parser.add_argument('-g', '--gpu', default='0', help='Choose which GPU to use.')
+    _parser.add_argument('--size', type=int, default=8)
+    _parser.add_argument('--num-widgets', type=int, default=500)
+    _parser.add_argument('--num-layers', type=int, default=2)
+    _args = _parser.parse_args()
+    os.environ['CUDA_VISIBLE_DEVICES'] = _args.gpu
+    exit(main(_args))
@@ -42,4 +42,10 @@ def get_session():
 
 
 def initialize_global_variables():
-    __GLOBAL.session.run(tf.global_variables_initializer())
+    """Initialize the global variables and the local variables.
+    The local variables are usually the states that should not be dumped, e.g., the gradient accumulators.
+    """
+    __GLOBAL.session.run(tf.group(
+        tf.global_variables_initializer(),
+        tf.local_variables_initializer()
+    ))
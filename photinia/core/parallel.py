@@ -0,0 +1,657 @@
+#!/usr/bin/env python3
+
+"""
+@author: xi
+@since: 2018-09-12
+"""
+
+import multiprocessing
+import multiprocessing.connection
+import queue
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from . import training
+from . import widgets
+
+
+class RingCommunicator(object):
+    """Ring communicator.
+    Collective operations among the local processes connected as a ring.
+    """
+
+    def __init__(self, rank, size, send_conn, recv_conn):
+        """Each process sends data to its right neighbour (rank + 1) and receives data from its
+        left neighbour (rank - 1). The communicators are usually created by launch().
+
+        Args:
+            rank (int): Rank of the current process.
+            size (int): Number of processes.
+            send_conn (multiprocessing.connection.Connection): Connection to the right neighbour.
+            recv_conn (multiprocessing.connection.Connection): Connection from the left neighbour.
+
+        """
+        self._rank = rank
+        self._size = size
+        self._send_conn = send_conn
+        self._recv_conn = recv_conn
+
+        self._recv_buffer = np.empty((0,), np.uint8)
+        self._send_queue = queue.Queue()
+        self._send_done = queue.Queue()
+        self._send_thread = None
+
+    @property
+    def rank(self):
+        return self._rank
+
+    @property
+    def size(self):
+        return self._size
+
+    def all_reduce(self, array):
+        """Sum the array over all processes in place, using the ring algorithm.
+        Each process sends and receives 2 * (size - 1) / size times the size of the array.
+
+        Args:
+            array (np.ndarray): A C-contiguous array. It is overwritten by the sum.
+
+        Returns:
+            np.ndarray: The array.
+
+        """
+        if self._size == 1:
+            return array
+        flat = array.reshape((-1,))
+        bounds = np.linspace(0, len(flat), self._size + 1).astype(np.int64)
+        chunks = [flat[bounds[i]:bounds[i + 1]] for i in range(self._size)]
+        #
+        # reduce-scatter
+        for i in range(self._size - 1):
+            send_chunk = chunks[(self._rank - i) % self._size]
+            recv_chunk = chunks[(self._rank - i - 1) % self._size]
+            recv_chunk += self._exchange(send_chunk, recv_chunk)
+        #
+        # all-gather
+        for i in range(self._size - 1):
+            send_chunk = chunks[(self._rank - i + 1) % self._size]
+            recv_chunk = chunks[(self._rank - i) % self._size]
+            recv_chunk[...] = self._exchange(send_chunk, recv_chunk)
+        return array
+
+    def broadcast(self, array, root=0):
+        """Broadcast the array from the root process in place.
+
+        Args:
+            array (np.ndarray): A C-contiguous array. It is overwritten by the root's value.
+            root (int): Rank of the root process.
+
+        Returns:
+            np.ndarray: The array.
+
+        """
+        if self._size == 1:
+            return array
+        flat = array.reshape((-1,))
+        if self._rank != root:
+            flat[...] = self._recv(flat)
+        if (self._rank + 1) % self._size != root:
+            self._send_conn.send_bytes(memoryview(flat).cast('B'))
+        return array
+
+    def barrier(self):
+        """Block until all processes reach this point.
+        """
+        self.all_reduce(np.zeros((1,), np.float32))
+
+    def _exchange(self, send_chunk, recv_chunk):
+        """Send a chunk to the right while receiving a chunk from the left.
+        The sending is done in another thread, so that the ring never deadlocks.
+        """
+        if self._send_thread is None:
+            self._send_thread = threading.Thread(target=self._send_loop)
+            self._send_thread.setDaemon(True)
+            self._send_thread.start()
+        self._send_queue.put(send_chunk)
+        chunk = self._recv(recv_chunk)
+        error = self._send_done.get()
+        if error is not None:
+            raise error
+        return chunk
+
+    def _send_loop(self):
+        """This method is executed in another thread!
+        """
+        while True:
+            chunk = self._send_queue.get()
+            try:
+                self._send_conn.send_bytes(memoryview(np.ascontiguousarray(chunk)).cast('B'))
+                self._send_done.put(None)
+            except Exception as e:
+                self._send_done.put(e)
+
+    def _recv(self, like):
+        nbytes = like.nbytes
+        if len(self._recv_buffer) < nbytes:
+            self._recv_buffer = np.empty((nbytes,), np.uint8)
+        size = self._recv_conn.recv_bytes_into(self._recv_buffer)
+        if size != nbytes:
+            raise RuntimeError('%d bytes expected, but %d bytes received.' % (nbytes, size))
+        return self._recv_buffer[:nbytes].view(like.dtype)
+
+
+def launch(fn, num_processes, args=()):
+    """Launch the local processes connected as a ring.
+
+    In each process, fn(comm, *args) is called, where comm is the RingCommunicator of the process.
+    The processes are started by "spawn", so fn and args must be picklable (e.g., fn is a module level
+    function), and the TF graph and session should be created inside fn.
+
+    Args:
+        fn: The function to run.
+        num_processes (int): Number of processes.
+        args (tuple|list): Extra arguments passed to fn.
+
+    Raises:
+        RuntimeError: If any of the processes fails.
+
+    """
+    if not (isinstance(num_processes, int) and num_processes > 0):
+        raise ValueError('Argument num_processes should be a positive integer.')
+    ctx = multiprocessing.get_context('spawn')
+    #
+    # Connection i links process i (send) to process i + 1 (receive).
+    pipes = [ctx.Pipe(duplex=False) for _ in range(num_processes)]
+    processes = [
+        ctx.Process(
+            target=_run_process,
+            args=(
+                fn,
+                rank,
+                num_processes,
+                pipes[rank][1],
+                pipes[(rank - 1) % num_processes][0],
+                tuple(args)
+            )
+        )
+        for rank in range(num_processes)
+    ]
+    for process in processes:
+        process.start()
+    #
+    # The parent's copies of the connections are closed, so that a process sees EOF when its neighbour exits.
+    for recv_conn, send_conn in pipes:
+        recv_conn.close()
+        send_conn.close()
+    #
+    # If any process fails, the others may block forever on the ring, so they are terminated.
+    running = {process.sentinel: rank for rank, process in enumerate(processes)}
+    failed = []
+    while len(running) > 0:
+        for sentinel in multiprocessing.connection.wait(list(running.keys())):
+            rank = running.pop(sentinel)
+            processes[rank].join()
+            if processes[rank].exitcode != 0:
+                failed.append(rank)
+        if len(failed) != 0:
+            for sentinel, rank in running.items():
+                processes[rank].terminate()
+            for process in processes:
+                process.join()
+            break
+    if len(failed) != 0:
+        raise RuntimeError('Process(es) %s failed.' % str(sorted(failed)))
+
+
+def _run_process(fn, rank, size, send_conn, recv_conn, args):
+    """This function is executed in the launched processes!
+    """
+    comm = RingCommunicator(rank, size, send_conn, recv_conn)
+    fn(comm, *args)
+
+
+class DataParallel(object):
+    """Data parallel training.
+    Each process computes the gradients on its own batch, then the gradients are averaged over all
+    processes by all-reduce before they are applied. Thus the replicas of the model stay in sync.
+    """
+
+    def __init__(self,
+                 comm,
+                 inputs,
+                 loss,
+                 optimizer,
+                 var_list=None,
+                 outputs=None,
+                 givens=None,
+                 sync_interval=None):
+        """Data parallel training.
+
+        Args:
+            comm (RingCommunicator): The communicator.
+            inputs (list[tf.Tensor]|tuple[tf.Tensor]|tf.Tensor): Input tensor(s).
+            loss (tf.Tensor): The loss to minimize.
+            optimizer: The TF optimizer.
+            var_list (list[tf.Variable]|tuple[tf.Variable]): Variables to train.
+                Default is all trainable variables.
+            outputs (list[tf.Tensor]|tuple[tf.Tensor]|tf.Tensor): Output tensor(s) returned by each call.
+                Default is the loss.
+            givens (dict[tf.Tensor, Any]): Preset values for some placeholder.
+            sync_interval (int): If given, the parameters are broadcast from process 0 every
+                "sync_interval" calls to remove any numerical drift between the replicas.
+
+        """
+        self._comm = comm
+        if outputs is None:
+            outputs = (loss,)
+        if not isinstance(outputs, (tuple, list)):
+            outputs = (outputs,)
+        self._num_outputs = len(outputs)
+        self._sync_interval = sync_interval
+
+        pair_list = optimizer.compute_gradients(loss, var_list=var_list)
+        pair_list = [(grad, var) for grad, var in pair_list if grad is not None]
+        self._var_list = [var for _, var in pair_list]
+        grad_list = [tf.convert_to_tensor(grad) for grad, _ in pair_list]
+
+        #
+        # Layout of the flat gradient/parameter buffer.
+        self._shapes = [tuple(var.shape.as_list()) for var in self._var_list]
+        sizes = [int(np.prod(shape)) for shape in self._shapes]
+        self._offsets = np.cumsum([0] + sizes)
+        self._buffer = np.empty((self._offsets[-1],), np.float32)
+
+        self._step_grad = training.Step(
+            inputs=inputs,
+            outputs=(*outputs, *grad_list),
+            givens=givens
+        )
+        grad_placeholders = [
+            widgets.placeholder('grad_%d' % i, shape, var.dtype.base_dtype)
+            for i, (shape, var) in enumerate(zip(self._shapes, self._var_list))
+        ]
+        self._step_apply = training.Step(
+            inputs=grad_placeholders,
+            updates=optimizer.apply_gradients(zip(grad_placeholders, self._var_list))
+        )
+        self._step_get = training.Step(
+            outputs=self._var_list
+        )
+        value_placeholders = [
+            widgets.placeholder('value_%d' % i, shape, var.dtype.base_dtype)
+            for i, (shape, var) in enumerate(zip(self._shapes, self._var_list))
+        ]
+        self._step_set = training.Step(
+            inputs=value_placeholders,
+            updates=tf.group(*[
+                tf.assign(var, value)
+                for var, value in zip(self._var_list, value_placeholders)
+            ])
+        )
+        self._num_calls = 0
+
+    @property
+    def comm(self):
+        return self._comm
+
+    @property
+    def var_list(self):
+        return self._var_list
+
+    def __call__(self, *args):
+        """Train one step on the local batch.
+
+        Args:
+            *args: Values of the inputs.
+
+        Returns:
+            list: Values of the outputs (computed on the local batch).
+
+        """
+        ret = self._step_grad(*args)
+        outputs, grad_list = ret[:self._num_outputs], ret[self._num_outputs:]
+        self._pack(grad_list)
+        self._comm.all_reduce(self._buffer)
+        self._buffer /= self._comm.size
+        self._step_apply(*self._unpack())
+        self._num_calls += 1
+        if self._sync_interval is not None and self._num_calls % self._sync_interval == 0:
+            self.sync_parameters()
+        return outputs
+
+    def sync_parameters(self, root=0):
+        """Broadcast the parameters from the root process.
+        This should be called once after the variables are initialized.
+
+        Args:
+            root (int): Rank of the root process.
+
+        """
+        self._pack(self._step_get())
+        self._comm.broadcast(self._buffer, root)
+        self._step_set(*self._unpack())
+
+    def _pack(self, value_list):
+        for i, value in enumerate(value_list):
+            self._buffer[self._offsets[i]:self._offsets[i + 1]] = np.reshape(value, (-1,))
+
+    def _unpack(self):
+        return [
+            self._buffer[self._offsets[i]:self._offsets[i + 1]].reshape(shape)
+            for i, shape in enumerate(self._shapes)
+        ]
+
+
+class SharedParameters(object):
+    """Shared parameters.
+    A flat float32 copy of the parameters in shared memory, guarded by a lock and tagged with a version.
+    """
+
+    def __init__(self, param_dict, ctx=None):
+        """The object should be created before the processes using it are started,
+        and passed to them as arguments.
+
+        Args:
+            param_dict (dict[str, np.ndarray]): Name to value dictionary of the initial parameters.
+            ctx: The multiprocessing context of the processes. Default is the "spawn" context.
+
+        """
+        if ctx is None:
+            ctx = multiprocessing.get_context('spawn')
+        self._names = sorted(param_dict.keys())
+        self._shapes = [np.shape(param_dict[name]) for name in self._names]
+        sizes = [int(np.prod(shape)) for shape in self._shapes]
+        self._offsets = np.cumsum([0] + sizes)
+        self._array = ctx.RawArray('f', max(int(self._offsets[-1]), 1))
+        self._lock = ctx.Lock()
+        self._version = ctx.RawValue('q', 0)
+        self._view = None
+        self.view()[...] = self.flatten(param_dict)
+
+    def __getstate__(self):
+        #
+        # The view is rebuilt in the new process.
+        state = self.__dict__.copy()
+        state['_view'] = None
+        return state
+
+    @property
+    def names(self):
+        return self._names
+
+    @property
+    def lock(self):
+        return self._lock
+
+    @property
+    def version(self):
+        return self._version.value
+
+    def view(self):
+        """Get the flat array backed by the shared memory.
+        The lock should be held when it is read or written.
+
+        Returns:
+            np.ndarray: The flat array.
+
+        """
+        if self._view is None:
+            self._view = np.frombuffer(self._array, np.float32, count=int(self._offsets[-1]))
+        return self._view
+
+    def read(self):
+        """Read a copy of the parameters.
+
+        Returns:
+            tuple: (flat_array, version)
+
+        """
+        with self._lock:
+            return self.view().copy(), self._version.value
+
+    def write(self, flat):
+        """Overwrite the parameters and increase the version.
+
+        Args:
+            flat (np.ndarray): The flat array.
+
+        """
+        with self._lock:
+            self.view()[...] = flat
+            self._version.value += 1
+
+    def add(self, delta, indices=None):
+        """Add a (dense or sparse) delta to the parameters and increase the version.
+
+        Args:
+            delta (np.ndarray): The delta values.
+            indices (np.ndarray): Indices of the values in the flat array. If None, delta is dense.
+
+        """
+        with self._lock:
+            if indices is None:
+                self.view()[...] += delta
+            else:
+                self.view()[indices] += delta
+            self._version.value += 1
+
+    def flatten(self, param_dict):
+        """Convert a parameter dictionary into a flat array.
+
+        Args:
+            param_dict (dict[str, np.ndarray]): Name to value dictionary.
+
+        Returns:
+            np.ndarray: The flat array.
+
+        """
+        flat = np.empty((int(self._offsets[-1]),), np.float32)
+        for i, name in enumerate(self._names):
+            flat[self._offsets[i]:self._offsets[i + 1]] = np.reshape(param_dict[name], (-1,))
+        return flat
+
+    def unflatten(self, flat):
+        """Convert a flat array into a parameter dictionary.
+
+        Args:
+            flat (np.ndarray): The flat array.
+
+        Returns:
+            dict[str, np.ndarray]: Name to value dictionary.
+
+        """
+        return {
+            name: flat[self._offsets[i]:self._offsets[i + 1]].reshape(shape)
+            for i, (name, shape) in enumerate(zip(self._names, self._shapes))
+        }
+
+
+class ParameterServer(object):
+    """Parameter server.
+    A local process holding the canonical parameters of a model. The workers push the deltas of their
+    local parameters and pull the fresh parameters asynchronously (Hogwild style).
+    """
+
+    def __init__(self, param_dict, max_staleness=None, ctx=None, max_clients=64):
+        """Parameter server.
+
+        Args:
+            param_dict (dict[str, np.ndarray]): The initial parameters, e.g., given by model.get_parameters().
+            max_staleness (int): If given, a delta computed from parameters older than "max_staleness"
+                versions is dropped.
+            ctx: The multiprocessing context of the worker processes. Default is the "spawn" context.
+            max_clients (int): Max number of clients that can register to the server.
+
+        """
+        if ctx is None:
+            ctx = multiprocessing.get_context('spawn')
+        self._ctx = ctx
+        self._params = SharedParameters(param_dict, ctx)
+        self._max_staleness = max_staleness
+        self._queue = ctx.Queue()
+        self._num_dropped = ctx.RawValue('q', 0)
+        #
+        # The last sequence number handled by the server for each client.
+        self._acks = ctx.RawArray('q', max_clients)
+        self._num_clients = ctx.RawValue('q', 0)
+        self._client_lock = ctx.Lock()
+        self._process = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_ctx'] = None
+        state['_process'] = None
+        return state
+
+    @property
+    def params(self):
+        return self._params
+
+    @property
+    def num_dropped(self):
+        return self._num_dropped.value
+
+    def start(self):
+        """Start the server process.
+        """
+        if self._process is not None:
+            raise RuntimeError('The parameter server has been started.')
+        self._process = self._ctx.Process(
+            target=_run_parameter_server,
+            args=(self._params, self._queue, self._max_staleness, self._num_dropped, self._acks)
+        )
+        self._process.daemon = True
+        self._process.start()
+
+    def stop(self):
+        """Stop the server process after all pushed deltas are applied.
+        """
+        if self._process is None:
+            return
+        self._queue.put(None)
+        self._process.join()
+        self._process = None
+
+    def register(self):
+        """Register a client. This is usually called by ParameterClient.
+
+        Returns:
+            int: The client ID.
+
+        """
+        with self._client_lock:
+            client_id = self._num_clients.value
+            if client_id >= len(self._acks):
+                raise RuntimeError('Too many clients. Increase max_clients of the parameter server.')
+            self._num_clients.value += 1
+        return client_id
+
+    def push(self, base_version, delta, indices=None, client_id=None, seq=None):
+        """Push a delta to the server. This is usually called by ParameterClient.
+
+        Args:
+            base_version (int): Version of the parameters that the delta is computed from.
+            delta (np.ndarray): The delta values.
+            indices (np.ndarray): Indices of the values in the flat array. If None, delta is dense.
+            client_id (int): ID of the client given by register(). Only needed by wait().
+            seq (int): Increasing sequence number of the push within the client. Only needed by wait().
+
+        """
+        self._queue.put((base_version, delta, indices, client_id, seq))
+
+    def wait(self, client_id, seq, interval=1e-4):
+        """Block until the push with the given sequence number has been handled (applied or dropped).
+
+        Args:
+            client_id (int): ID of the client.
+            seq (int): Sequence number of the push.
+            interval (float): Polling interval in seconds.
+
+        """
+        while self._acks[client_id] < seq:
+            time.sleep(interval)
+
+
+def _run_parameter_server(params, request_queue, max_staleness, num_dropped, acks):
+    """This function is executed in the server process!
+    """
+    while True:
+        request = request_queue.get()
+        if request is None:
+            break
+        base_version, delta, indices, client_id, seq = request
+        if max_staleness is not None and params.version - base_version > max_staleness:
+            num_dropped.value += 1
+        else:
+            params.add(delta, indices)
+        if client_id is not None:
+            acks[client_id] = seq
+
+
+class ParameterClient(object):
+    """Parameter client.
+    The worker side of ParameterServer.
+    """
+
+    def __init__(self,
+                 server,
+                 trainable,
+                 push_interval=10,
+                 sparse_ratio=0.1):
+        """Each worker trains its own replica locally. Every "push_interval" steps, the change of the
+        local parameters since the last pull is pushed to the server, and the fresh parameters are
+        pulled back. pull() should be called once after the variables are initialized.
+
+        Args:
+            server (ParameterServer): The parameter server.
+            trainable (photinia.Trainable): The local replica (e.g., the model).
+            push_interval (int): Number of local steps between two pushes.
+            sparse_ratio (float): If the ratio of the changed values is not greater than this,
+                the delta is pushed in the sparse form.
+
+        """
+        self._server = server
+        self._trainable = trainable
+        self._push_interval = push_interval
+        self._sparse_ratio = sparse_ratio
+
+        self._base = None
+        self._base_version = None
+        self._num_steps = 0
+        self._client_id = server.register()
+        self._seq = 0
+
+    def pull(self):
+        """Load the parameters from the server into the local replica.
+        """
+        params = self._server.params
+        self._base, self._base_version = params.read()
+        self._trainable.set_parameters(params.unflatten(self._base))
+
+    def push(self):
+        """Push the change of the local parameters since the last pull.
+        It returns after the server has handled the delta, so that a following pull() contains it.
+        """
+        if self._base is None:
+            raise RuntimeError('pull() should be called before push().')
+        current = self._server.params.flatten(self._trainable.get_parameters())
+        delta = current - self._base
+        indices = np.flatnonzero(delta)
+        self._seq += 1
+        if len(indices) <= self._sparse_ratio * len(delta):
+            self._server.push(self._base_version, delta[indices], indices, self._client_id, self._seq)
+        else:
+            self._server.push(self._base_version, delta, None, self._client_id, self._seq)
+        self._server.wait(self._client_id, self._seq)
+
+    def step(self):
+        """Notify the client that a local step is done.
+        The parameters are pushed and pulled every "push_interval" steps.
+        """
+        self._num_steps += 1
+        if self._num_steps % self._push_interval == 0:
+            self.push()
+            self.pull()
@@ -6,13 +6,141 @@
 """
 
 import collections
+import threading
 
+import numpy as np
 import tensorflow as tf
+from tensorflow.core.protobuf import config_pb2
 
 from . import context
 from . import widgets
 
 
+class InputQueue(object):
+    """Input queue.
+    Stage the input batches in the TF runtime so that feeding overlaps with training.
+    """
+
+    def __init__(self,
+                 inputs,
+                 capacity=8,
+                 name='input_queue'):
+        """A background thread reads batches from a DataSource and enqueues them into a FIFO queue,
+        while the graph is built on the dequeued tensors. Thus a Step using this queue as its inputs
+        only dequeues a ready batch when it is called, and the host side batch preparation runs
+        concurrently with session.run().
+
+        The dequeued tensors are wrapped by tf.placeholder_with_default(), so they can still be fed
+        directly by other steps (e.g., for prediction), in which case nothing is dequeued.
+
+        Args:
+            inputs (list[tf.Tensor]|tuple[tf.Tensor]|tf.Tensor): Placeholder(s) describing the columns
+                of the batches given by the data source.
+            capacity (int): Max number of batches in the queue.
+            name (str): Name scope of the queue operations.
+
+        """
+        if not isinstance(inputs, (tuple, list)):
+            inputs = (inputs,)
+        if len(inputs) == 0:
+            raise ValueError('At least one input should be given.')
+        self._inputs = inputs
+        with tf.name_scope(name):
+            self._queue = tf.FIFOQueue(capacity, dtypes=[input_.dtype for input_ in inputs])
+            self._enqueue_op = self._queue.enqueue(inputs)
+            self._close_op = self._queue.close(cancel_pending_enqueues=True)
+            self._size = self._queue.size()
+            dequeued = self._queue.dequeue()
+            if not isinstance(dequeued, (tuple, list)):
+                dequeued = (dequeued,)
+            self._outputs = tuple(
+                tf.placeholder_with_default(tensor, shape=input_.shape)
+                for tensor, input_ in zip(dequeued, inputs)
+            )
+
+        self._session = None
+        self._thread = None
+        self._stopped = False
+        self._error = None
+
+    @property
+    def inputs(self):
+        return self._inputs
+
+    @property
+    def outputs(self):
+        """Tensors used to build the graph instead of the input placeholders.
+
+        Returns:
+            tuple[tf.Tensor]: The dequeued tensors.
+
+        """
+        return self._outputs
+
+    @property
+    def error(self):
+        """The exception raised by the loading thread, if any.
+        """
+        return self._error
+
+    def size(self):
+        """Get the number of batches in the queue.
+
+        Returns:
+            int: The size.
+
+        """
+        return context.get_session().run(self._size)
+
+    def start(self, data_source):
+        """Start the loading thread.
+
+        Note that the end of epoch (None) is skipped, so the data source is iterated over and over again.
+
+        Args:
+            data_source (photinia.DataSource): The data source giving the batches.
+
+        """
+        if self._thread is not None:
+            raise RuntimeError('The input queue has been started.')
+        self._session = context.get_session()
+        self._thread = threading.Thread(target=self._load, args=(data_source,))
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the loading thread and close the queue.
+        """
+        if self._thread is None:
+            return
+        self._stopped = True
+        self._session.run(self._close_op)
+        self._thread.join()
+
+    def _load(self, data_source):
+        """This method is executed in another thread!
+        """
+        feed_dict = {}
+        num_none = 0
+        try:
+            while not self._stopped:
+                batch = data_source.next()
+                if batch is None:
+                    num_none += 1
+                    if num_none > 1:
+                        raise RuntimeError('Too many "None" returned by data source.')
+                    continue
+                num_none = 0
+                for placeholder, value in zip(self._inputs, batch):
+                    feed_dict[placeholder] = value
+                self._session.run(self._enqueue_op, feed_dict=feed_dict)
+        except tf.errors.CancelledError:
+            pass
+        except Exception as e:
+            self._error = e
+            self._session.run(self._close_op)
+
+
 class Step(object):
     """Train step.
     Trainable is trained and tested step by step~
@@ -27,8 +155,11 @@ class Step(object):
         """A slot object is a callable which accepts multiple tensor inputs
         and gives out multiple outputs.
 
+        If "inputs" is an InputQueue, the step takes no argument when it is called,
+        and the input batch is dequeued from the queue.
+
         Args:
-            inputs (list[tf.Tensor]|tuple[tf.Tensor]|tf.Tensor):
+            inputs (list[tf.Tensor]|tuple[tf.Tensor]|tf.Tensor|InputQueue):
                 Input tensor(s).
             outputs (dict[str, tf.Tensor]|list[tf.Tensor]|tuple[tf.Tensor]|tf.Tensor):
                 Output tensor(s).
@@ -42,6 +173,10 @@ class Step(object):
         self._session = context.get_session()
         #
         # Inputs.
+        self._input_queue = None
+        if isinstance(inputs, InputQueue):
+            self._input_queue = inputs
+            inputs = ()
         if inputs is None:
             inputs = ()
         if not isinstance(inputs, (tuple, list)):
@@ -77,10 +212,48 @@ class Step(object):
             callbacks = (callbacks,)
         self._callbacks = callbacks
         #
-        self._feed_dict = givens.copy()
-        self._fetches = (outputs, updates)
         if len(outputs) == 0 and len(updates) == 0:
             raise ValueError('At least one output or update should be set.')
+        #
+        # The feeds, fetches and targets are resolved only once here, and a callable is created
+        # from them in the session. Note that "session.make_callable()" falls back to "session.run()"
+        # when a feed list is given, so the callable is built from "CallableOptions" directly.
+        # This relies on "Session._make_callable_from_options()", which is available since TensorFlow 1.8.
+        # With older versions, or if the outputs are not flat (e.g., nested structures or IndexedSlices),
+        # the public "session.make_callable()" is used.
+        # The given values are passed after the inputs when the callable is invoked.
+        graph = self._session.graph
+        feeds = [graph.as_graph_element(feed) for feed in list(inputs) + list(givens.keys())]
+        self._feed_dtypes = tuple(feed.dtype.as_numpy_dtype for feed in feeds)
+        self._given_values = tuple(
+            np.asarray(value, dtype=dtype)
+            for value, dtype in zip(givens.values(), self._feed_dtypes[len(inputs):])
+        )
+        if isinstance(outputs, dict):
+            self._output_keys = list(outputs.keys())
+            fetches = [outputs[key] for key in self._output_keys]
+        else:
+            self._output_keys = None
+            fetches = outputs
+        self._flat = hasattr(self._session, '_make_callable_from_options') \
+            and all(isinstance(fetch, (tf.Tensor, tf.Variable)) for fetch in fetches) \
+            and all(isinstance(update, (tf.Tensor, tf.Variable, tf.Operation)) for update in updates)
+        if self._flat:
+            fetches = [graph.as_graph_element(fetch) for fetch in fetches]
+            targets = [graph.as_graph_element(update, allow_operation=True) for update in updates]
+            options = config_pb2.CallableOptions()
+            options.feed.extend([feed.name for feed in feeds])
+            options.fetch.extend([fetch.name for fetch in fetches])
+            options.target.extend([
+                target.op.name if isinstance(target, tf.Tensor) else target.name
+                for target in targets
+            ])
+            self._callable = self._session._make_callable_from_options(options)
+        else:
+            self._callable = self._session.make_callable(
+                fetches=(outputs, updates),
+                feed_list=feeds
+            )
 
     @property
     def outputs(self):
@@ -98,6 +271,10 @@ class Step(object):
     def givens(self):
         return self._givens
 
+    @property
+    def input_queue(self):
+        return self._input_queue
+
     def __call__(self, *args):
         #
         # Check input length.
@@ -105,12 +282,29 @@ class Step(object):
             print(len(args), len(self._inputs))
             raise ValueError('The count of parameters is not match the inputs.')
         #
-        # Make "feed_dict".
-        for index, placeholder in enumerate(self._inputs):
-            self._feed_dict[placeholder] = args[index]
-        #
         # Run the graph on the session.
-        ret = self._session.run(fetches=self._fetches, feed_dict=self._feed_dict)[0]
+        try:
+            values = self._callable(*(
+                np.asarray(arg, dtype=dtype)
+                for arg, dtype in zip(args, self._feed_dtypes)
+            ), *self._given_values)
+        except tf.errors.OutOfRangeError as e:
+            if self._input_queue is not None and self._input_queue.error is not None:
+                raise self._input_queue.error
+            raise e
+        #
+        # Restore the structure of the outputs.
+        outputs = self._outputs
+        if not self._flat:
+            ret = values[0]
+        elif self._output_keys is not None:
+            ret = type(outputs)()
+            for key, value in zip(self._output_keys, values):
+                ret[key] = value
+        elif isinstance(outputs, tuple):
+            ret = tuple(values)
+        else:
+            ret = list(values)
         for callback in self._callbacks:
             callback(ret)
         return ret
@@ -159,7 +353,7 @@ class Model(widgets.Trainable):
         and gives out multiple outputs.
 
         Args:
-            inputs (list[tf.Tensor]|tuple[tf.Tensor]|tf.Tensor):
+            inputs (list[tf.Tensor]|tuple[tf.Tensor]|tf.Tensor|InputQueue):
                 Input tensor(s).
             outputs (dict|list|tuple|tf.Tensor):
                 Output tensor(s).
@@ -203,63 +397,3 @@ class Model(widgets.Trainable):
                 'Trainer %s does not have a slot named %s.' % (self._full_name, name)
             )
         return self._slots[name]
-
-# class MPIDispatcher(Fitter):
-#     """MPI Dispatcher
-#
-#     This class is used for the distributional training of the model. (Based on MPI).
-#     So, the servers should have one of the MPI implementation (e.g., openmpi, mpich) installed.
-#     If this fitter is instanced and added to a trainer, the program should be run using the MPI command:
-#
-#         mpiexec -n {num_processes} python3 {python_file.py}
-#     """
-#
-#     def __init__(self,
-#                  sync_interval=2):
-#         super(MPIDispatcher, self).__init__(1, 1)
-#         from mpi4py import MPI
-#         self._sync_interval = sync_interval
-#         #
-#         self._comm = MPI.COMM_WORLD
-#         self._rank = self._comm.Get_rank()
-#         self._size = self._comm.Get_size()
-#         #
-#         # This is very important since we should let the processes to use DIFFERENT GPUs of the same server.
-#         # While, if the processes run on different servers, this can cause problems.
-#         # TODO: Thus we need to further modify the assign policy to choose the GPU automatically.
-#         gpu_list = [int(item) for item in os.environ['CUDA_VISIBLE_DEVICES'].split(',')]
-#         gpu = gpu_list[self._rank % len(gpu_list)]
-#         os.environ['CUDA_VISIBLE_DEVICES'] = str(gpu)
-#
-#     def _fit(self, i, max_loop, context):
-#         trainer = context[settings.CONTEXT_TRAINER]
-#         if i == 1:
-#             self._init_all(trainer)
-#         elif i % self._sync_interval == 0:
-#             self._update_all(trainer)
-#
-#     def _init_all(self, trainer):
-#         if self._rank == 0:
-#             self._comm.bcast(trainer.parameters, root=0)
-#         else:
-#             trainer.parameters = self._comm.bcast(None, root=0)
-#
-#     def _update_all(self, trainer):
-#         if self._rank == 0:
-#             #
-#             # Gather parameters from all processes (include the master itself).
-#             # Compute the mean value for each parameter.
-#             # Then, broadcast them.
-#             param_list = self._comm.gather(trainer.parameters, root=0)
-#             new_params = collections.defaultdict(list)
-#             for params in param_list:
-#                 for name, value in params.items():
-#                     new_params[name].append(value)
-#             new_params = {key: np.mean(value_list, axis=0) for key, value_list in new_params.items()}
-#             new_params = trainer.parameters = self._comm.bcast(new_params, root=0)
-#         else:
-#             self._comm.gather(trainer.parameters, root=0)
-#             new_params = self._comm.bcast(None, root=0)
-#         #
-#         # Update the parameters to the same version for all processes.
-#         trainer.parameters = new_params
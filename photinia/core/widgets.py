@@ -5,6 +5,7 @@
 @since: 2016-11-11
 """
 
+import collections
 import math
 import threading
 
@@ -19,7 +20,9 @@ from .. import ops
 
 def variable(name,
              initial_value,
-             trainable=True):
+             trainable=True,
+             dtype=None,
+             collections=None):
     """Create a variable.
     Shortcut to "tf.Variable()".
 
@@ -29,6 +32,9 @@ def variable(name,
             which is the initial value for the Variable.
         trainable (bool): If `True`, the default, also adds the variable to the graph collection
             `GraphKeys.TRAINABLE_VARIABLES`.
+        dtype (tf.DType): Data type of the variable. Default is "conf.dtype".
+        collections (list[str]): Graph collections keys. The new variable is added to these collections.
+            Defaults to `[GraphKeys.GLOBAL_VARIABLES]`.
 
     Returns:
         tf.Variable: The variable object.
@@ -43,7 +49,8 @@ def variable(name,
         name=name,
         initial_value=initial_value,
         trainable=trainable,
-        dtype=conf.dtype
+        dtype=dtype if dtype is not None else conf.dtype,
+        collections=collections
     )
 
 
@@ -66,6 +73,123 @@ def placeholder(name,
     return tf.placeholder(name=name, shape=shape, dtype=dtype)
 
 
+class _VariableIndex(object):
+    """Index of the variables of a graph.
+
+    The variables are organized as a prefix trie over the "/" separated name segments, so that the
+    variables of a widget can be found without scanning all variables of the graph.
+    The index is updated incrementally from the graph collections.
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+        self._lock = threading.Lock()
+        self._global_root = {}
+        self._trainable_root = {}
+        self._name_dict = {}
+        self._num_global = 0
+        self._num_trainable = 0
+        self._assign_dict = {}
+
+    @property
+    def graph(self):
+        return self._graph
+
+    def update(self):
+        """Index the variables added to the graph collections since the last update.
+        """
+        global_vars = self._graph.get_collection_ref(tf.GraphKeys.GLOBAL_VARIABLES)
+        trainable_vars = self._graph.get_collection_ref(tf.GraphKeys.TRAINABLE_VARIABLES)
+        if len(global_vars) == self._num_global and len(trainable_vars) == self._num_trainable:
+            return
+        with self._lock:
+            if len(global_vars) < self._num_global or len(trainable_vars) < self._num_trainable:
+                #
+                # Some variables have been removed from the collections. Rebuild the index.
+                self._global_root = {}
+                self._trainable_root = {}
+                self._name_dict = {}
+                self._num_global = 0
+                self._num_trainable = 0
+            for index in range(self._num_global, len(global_vars)):
+                var = global_vars[index]
+                self._insert(self._global_root, index, var)
+                self._name_dict.setdefault(var.name, var)
+            self._num_global = len(global_vars)
+            for index in range(self._num_trainable, len(trainable_vars)):
+                self._insert(self._trainable_root, index, trainable_vars[index])
+            self._num_trainable = len(trainable_vars)
+
+    @staticmethod
+    def _insert(root, index, var):
+        node = root
+        for segment in var.name.split('/')[:-1]:
+            node = node.setdefault(segment, {})
+        node.setdefault(None, []).append((index, var))
+
+    def get_variables(self, prefix, trainable=False):
+        """Get the variables whose names start with the prefix.
+
+        Args:
+            prefix (str): The prefix. It must end with "/".
+            trainable (bool): Only get the trainable variables.
+
+        Returns:
+            list[tf.Variable]: The variables, in the order of creation.
+
+        """
+        self.update()
+        node = self._trainable_root if trainable else self._global_root
+        for segment in prefix.split('/')[:-1]:
+            if segment not in node:
+                return list()
+            node = node[segment]
+        item_list = list()
+        stack = [node]
+        while len(stack) != 0:
+            node = stack.pop()
+            for key, value in node.items():
+                if key is None:
+                    item_list.extend(value)
+                else:
+                    stack.append(value)
+        item_list.sort(key=lambda item: item[0])
+        return [var for _, var in item_list]
+
+    def get_variable(self, name):
+        """Get the variable by its full name.
+
+        Args:
+            name (str): Full name of the variable, e.g., "model/layer/w:0".
+
+        Returns:
+            tf.Variable: The variable. None if not found.
+
+        """
+        self.update()
+        return self._name_dict.get(name)
+
+    def get_assign(self, var):
+        """Get the placeholder and the assign operation used to set the value of a variable.
+        They are created on the first call and shared by all the widgets containing the variable.
+
+        Args:
+            var (tf.Variable): The variable.
+
+        Returns:
+            tuple: (placeholder, assign operation)
+
+        """
+        with self._lock:
+            pair = self._assign_dict.get(var.name)
+            if pair is None:
+                with self._graph.as_default():
+                    placeholder = tf.placeholder(dtype=var.dtype.base_dtype, shape=var.shape)
+                    pair = (placeholder, tf.assign(var, placeholder))
+                self._assign_dict[var.name] = pair
+            return pair
+
+
 class Trainable(object):
     """Trainable
     A trainable object contains TensorFlow Variables.
@@ -73,6 +197,7 @@ class Trainable(object):
 
     LOCK = threading.Semaphore(1)
     INSTANCES = dict()
+    VARIABLE_INDEX = None
 
     def __init__(self, name, build=True):
         """Construct a widget.
@@ -92,6 +217,8 @@ class Trainable(object):
         self._full_name = None
         self._prefix = None
         self._built = False
+        self._param_vars = None
+        self._param_assigns = None
         if build:
             self.build()
 
@@ -132,11 +259,16 @@ class Trainable(object):
         with tf.variable_scope(self._name):
             self._build()
             self._built = True
+        self._get_variable_index().update()
 
         with self.LOCK:
             if self._full_name in self.INSTANCES:
                 raise ValueError('Duplicated trainable name %s.' % self._full_name)
             self.INSTANCES[self._full_name] = self
+        #
+        # The assign operations used by set_parameters() are created with the widget,
+        # so that loading the parameters adds no node to the graph, which may have been finalized.
+        self._get_param_assigns()
         return self
 
     def _build(self):
@@ -159,9 +291,7 @@ class Trainable(object):
         """
         if self._name is None:
             return list()
-        prefix = self._prefix
-        global_vars = tf.global_variables()
-        return [var for var in global_vars if var.name.startswith(prefix)]
+        return self._get_variable_index().get_variables(self._prefix)
 
     def get_trainable_variables(self):
         """Get variables(tensors that marked as "trainable") of the widget.
@@ -172,8 +302,18 @@ class Trainable(object):
         """
         if self._name is None:
             return list()
-        trainable_vars = tf.trainable_variables()
-        return [var for var in trainable_vars if var.name.startswith(self._prefix)]
+        return self._get_variable_index().get_variables(self._prefix, trainable=True)
+
+    @classmethod
+    def _get_variable_index(cls):
+        """Get the variable index of the default graph.
+        """
+        graph = tf.get_default_graph()
+        with cls.LOCK:
+            index = Trainable.VARIABLE_INDEX
+            if index is None or index.graph is not graph:
+                index = Trainable.VARIABLE_INDEX = _VariableIndex(graph)
+        return index
 
     @property
     def full_name(self):
@@ -206,13 +346,12 @@ class Trainable(object):
             dict[str, np.ndarray]: Name to value dictionary of the parameters.
 
         """
-        var_list = self.get_trainable_variables()
-        param_dict = {var.name: var for var in var_list}
-        param_dict = context.get_session().run(param_dict)
+        param_dict = context.get_session().run(self._get_param_vars())
         return param_dict
 
     def set_parameters(self, param_dict, strict=True):
         """Set values to the parameters.
+        All the values are assigned in one session run.
 
         Args:
             param_dict (dict[str, np.ndarray]): Name to value dictionary.
@@ -223,16 +362,50 @@ class Trainable(object):
             ValueError: If strict is True and there are some values in the dictionary unused.
 
         """
-        var_list = self.get_trainable_variables()
-        var_dict = {var.name: var for var in var_list}
-        session = context.get_session()
+        var_dict = self._get_param_vars()
+        assign_dict = self._get_param_assigns()
+        feed_dict = {}
+        assign_list = []
         for name, value in param_dict.items():
             name_replace = name.replace('\\', '/')
             if name_replace not in var_dict:
                 if strict:
                     raise ValueError('%s is not in this model.' % name)
-            var = var_dict[name_replace]
-            var.load(value, session=session)
+                continue
+            placeholder, assign = assign_dict[name_replace]
+            feed_dict[placeholder] = value
+            assign_list.append(assign)
+        if len(assign_list) != 0:
+            context.get_session().run(assign_list, feed_dict=feed_dict)
+
+    def _get_param_vars(self):
+        """Get the name to variable dictionary of the parameters.
+        The dictionary is cached after the widget is built.
+        """
+        if self._param_vars is not None:
+            return self._param_vars
+        var_list = self.get_trainable_variables()
+        param_vars = collections.OrderedDict((var.name, var) for var in var_list)
+        if self._built:
+            self._param_vars = param_vars
+        return param_vars
+
+    def _get_param_assigns(self):
+        """Get the name to (placeholder, assign operation) dictionary of the parameters.
+        The placeholders and the assign operations are created when the widget is built.
+        """
+        if self._param_assigns is not None:
+            return self._param_assigns
+        index = self._get_variable_index()
+        with tf.name_scope(self._prefix if self._prefix is not None else ''):
+            with tf.name_scope('assign_parameters'):
+                param_assigns = {
+                    name: index.get_assign(var)
+                    for name, var in self._get_param_vars().items()
+                }
+        if self._built:
+            self._param_assigns = param_assigns
+        return param_assigns
 
     def get_operation(self, name):
         name = self._prefix + name
@@ -256,10 +429,7 @@ class Trainable(object):
             name = '%s%s:0' % (self._prefix, name)
         else:
             name = self._prefix + name
-        for var in tf.global_variables():
-            if name == var.name:
-                return var
-        return None
+        return self._get_variable_index().get_variable(name)
 
     def __getattr__(self, name):
         name = self._prefix + name
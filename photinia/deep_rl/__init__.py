@@ -9,3 +9,4 @@ from .common import *
 
 from . import actors_critics
 from . import ddpg
+from . import distributed
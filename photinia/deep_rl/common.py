@@ -5,7 +5,9 @@
 @since: 2018-06-20
 """
 
+import multiprocessing
 import random
+import traceback
 
 import numpy as np
 import tensorflow as tf
@@ -18,16 +20,36 @@ class ReplayMemory(object):
     def __init__(self, buffer_size):
         """Replay memory.
 
+        The transitions are stored in preallocated arrays (one array for each of s, a, r, s_ and done), which are
+        used as a ring buffer. The arrays are allocated when the first transition is put, using its shapes and
+        dtypes.
+
         Args:
             buffer_size (int): Max buffer size.
 
         """
         self._buffer_size = buffer_size
-        self._buffer = list()
+        self._columns = None
+        self._size = 0
         self._pointer = 0
 
+    def __len__(self):
+        return self._size
+
     def full(self):
-        return len(self._buffer) >= self._buffer_size
+        return self._size >= self._buffer_size
+
+    def _allocate(self, s, a, r, s_, done):
+        s = np.asarray(s)
+        a = np.asarray(a)
+        s_ = np.asarray(s_)
+        self._columns = (
+            np.empty((self._buffer_size,) + s.shape, s.dtype),
+            np.empty((self._buffer_size,) + a.shape, a.dtype),
+            np.empty((self._buffer_size,) + np.shape(r), np.float32),
+            np.empty((self._buffer_size,) + s_.shape, s_.dtype),
+            np.empty((self._buffer_size,) + np.shape(done), np.bool_)
+        )
 
     def put(self, s, a, r, s_, done):
         """Put a transition tuple to the replay memory.
@@ -40,12 +62,47 @@ class ReplayMemory(object):
             done (bool): Is terminal?
 
         """
-        row = (s, a, r, s_, done)
-        if len(self._buffer) < self._buffer_size:
-            self._buffer.append(row)
-        else:
-            self._buffer[self._pointer] = row
-            self._pointer = (self._pointer + 1) % self._buffer_size
+        if self._columns is None:
+            self._allocate(s, a, r, s_, done)
+        i = self._pointer
+        for column, value in zip(self._columns, (s, a, r, s_, done)):
+            column[i] = value
+        self._pointer = (i + 1) % self._buffer_size
+        if self._size < self._buffer_size:
+            self._size += 1
+
+    def put_batch(self, s, a, r, s_, done):
+        """Put a batch of transitions to the replay memory.
+
+        Args:
+            s (numpy.ndarray): States s_t.
+            a ((numpy.ndarray)): Actions a_t.
+            r (numpy.ndarray): Rewards r_{t + 1}.
+            s_ (numpy.ndarray): Transition states s_{t + 1}.
+            done (numpy.ndarray): Are terminal?
+
+        Returns:
+            numpy.ndarray: Indices where the transitions are stored.
+
+        """
+        batch = (np.asarray(s), np.asarray(a), np.asarray(r), np.asarray(s_), np.asarray(done))
+        batch_size = len(batch[0])
+        if batch_size == 0:
+            return np.empty((0,), np.int64)
+        if self._columns is None:
+            self._allocate(*(value[0] for value in batch))
+        if batch_size > self._buffer_size:
+            #
+            # Only the last transitions can be kept.
+            self._pointer = (self._pointer + batch_size - self._buffer_size) % self._buffer_size
+            batch = tuple(value[-self._buffer_size:] for value in batch)
+            batch_size = self._buffer_size
+        indices = (self._pointer + np.arange(batch_size)) % self._buffer_size
+        for column, value in zip(self._columns, batch):
+            column[indices] = value
+        self._pointer = (self._pointer + batch_size) % self._buffer_size
+        self._size = min(self._size + batch_size, self._buffer_size)
+        return indices
 
     def get(self, batch_size):
         """Get a random batch of transitions from the memory.
@@ -54,18 +111,174 @@ class ReplayMemory(object):
             batch_size (int): Batch size.
 
         Returns:
-            list[tuple]: List of transition tuples.
+            tuple[numpy.ndarray]: The columns (s, a, r, s_, done) of the batch.
 
         """
-        if batch_size <= len(self._buffer):
-            rows = random.sample(list(self._buffer), batch_size)
-        else:
-            rows = self._buffer
-        columns = (list(), list(), list(), list(), list())
-        for row in rows:
-            for i in range(5):
-                columns[i].append(row[i])
-        return columns
+        if self._columns is None:
+            return tuple(list() for _ in range(5))
+        if batch_size <= self._size:
+            indices = np.array(random.sample(range(self._size), batch_size), dtype=np.int64)
+            return tuple(column[indices] for column in self._columns)
+        return tuple(column[:self._size].copy() for column in self._columns)
+
+
+class SumTree(object):
+
+    def __init__(self, capacity):
+        """Sum tree stored in a flat array.
+
+        The leaves hold non-negative values, and each internal node holds the sum of its two children.
+        Both updating and searching process a batch of indices level by level, i.e., O(log n) vectorized steps.
+
+        Args:
+            capacity (int): Number of leaves.
+
+        """
+        self._capacity = capacity
+        self._num_leaves = 1 << max(capacity - 1, 0).bit_length()
+        self._depth = self._num_leaves.bit_length() - 1
+        self._tree = np.zeros((2 * self._num_leaves,), np.float64)
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def total(self):
+        return self._tree[1]
+
+    def get(self, indices):
+        """Get the values of the leaves.
+
+        Args:
+            indices (numpy.ndarray): Indices of the leaves.
+
+        Returns:
+            numpy.ndarray: The values.
+
+        """
+        return self._tree[np.asarray(indices, np.int64) + self._num_leaves]
+
+    def update(self, indices, values):
+        """Set values to the leaves and update their ancestors.
+
+        Args:
+            indices (numpy.ndarray): Indices of the leaves.
+            values (numpy.ndarray): Non-negative values.
+
+        """
+        tree = self._tree
+        nodes = np.asarray(indices, np.int64) + self._num_leaves
+        tree[nodes] = values
+        for _ in range(self._depth):
+            nodes = np.unique(nodes >> 1)
+            tree[nodes] = tree[2 * nodes] + tree[2 * nodes + 1]
+
+    def find(self, values):
+        """Find the leaves where the given prefix sums fall in.
+
+        Args:
+            values (numpy.ndarray): Prefix sums in [0, total].
+
+        Returns:
+            numpy.ndarray: Indices of the leaves.
+
+        """
+        tree = self._tree
+        values = np.array(values, np.float64)
+        nodes = np.ones(values.shape, np.int64)
+        for _ in range(self._depth):
+            left = 2 * nodes
+            left_sum = tree[left]
+            go_right = ((values > left_sum) | (left_sum <= 0)) & (tree[left + 1] > 0)
+            values = np.where(go_right, values - left_sum, values)
+            nodes = left + go_right
+        return nodes - self._num_leaves
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+
+    def __init__(self, buffer_size, alpha=0.6, beta=0.4, epsilon=1e-6):
+        """Prioritized replay memory.
+
+        A transition i is sampled with probability P(i) = p_i^alpha / sum_k p_k^alpha, where p_i = |td_error_i| + epsilon.
+        New transitions get the max priority seen so far, so they are sampled at least once with high probability.
+
+        Args:
+            buffer_size (int): Max buffer size.
+            alpha (float): How much prioritization is used. 0 means uniform sampling.
+            beta (float): Exponent of the importance sampling weights. 1 means full compensation.
+            epsilon (float): Small value added to the absolute TD errors.
+
+        """
+        self._alpha = alpha
+        self._beta = beta
+        self._epsilon = epsilon
+        self._tree = SumTree(buffer_size)
+        self._max_priority = 1.0
+        super(PrioritizedReplayMemory, self).__init__(buffer_size)
+
+    @property
+    def beta(self):
+        return self._beta
+
+    @beta.setter
+    def beta(self, value):
+        self._beta = value
+
+    def put(self, s, a, r, s_, done):
+        i = self._pointer
+        super(PrioritizedReplayMemory, self).put(s, a, r, s_, done)
+        self._tree.update([i], [self._max_priority])
+
+    def put_batch(self, s, a, r, s_, done):
+        indices = super(PrioritizedReplayMemory, self).put_batch(s, a, r, s_, done)
+        self._tree.update(indices, np.full(indices.shape, self._max_priority))
+        return indices
+
+    def sample(self, batch_size):
+        """Get a batch of transitions using stratified sampling.
+
+        The range of the total priority is divided into batch_size segments, and one transition is sampled from
+        each of them.
+
+        Args:
+            batch_size (int): Batch size.
+
+        Returns:
+            tuple: (columns, indices, weights). "columns" are the same as the return value of get().
+                "indices" are used to update the priorities. "weights" are the importance sampling weights
+                normalized by their max value.
+
+        """
+        if self._columns is None:
+            return tuple(list() for _ in range(5)), np.empty((0,), np.int64), np.empty((0,), np.float32)
+        size = self._size
+        batch_size = min(batch_size, size)
+        total = self._tree.total
+        values = (np.arange(batch_size) + np.random.uniform(size=batch_size)) * (total / batch_size)
+        indices = np.minimum(self._tree.find(values), size - 1)
+        probs = self._tree.get(indices) / total
+        weights = (size * probs) ** -self._beta
+        weights = (weights / weights.max()).astype(np.float32)
+        columns = tuple(column[indices] for column in self._columns)
+        return columns, indices, weights
+
+    def get(self, batch_size):
+        return self.sample(batch_size)[0]
+
+    def update_priorities(self, indices, td_errors):
+        """Update the priorities of the sampled transitions.
+
+        Args:
+            indices (numpy.ndarray): Indices returned by sample().
+            td_errors (numpy.ndarray): TD errors of the transitions.
+
+        """
+        priorities = (np.abs(td_errors) + self._epsilon) ** self._alpha
+        self._tree.update(indices, priorities)
+        if len(priorities) > 0:
+            self._max_priority = max(self._max_priority, float(np.max(priorities)))
 
 
 class NormalNoise(object):
@@ -84,3 +297,185 @@ class NormalNoise(object):
 
     def discount(self, factor=0.999):
         self._stddev *= factor
+
+
+class EnvPool(object):
+
+    def __init__(self, env_fn, num_envs, num_workers=None, ctx=None):
+        """Step multiple environments in lockstep.
+
+        The environments are distributed to worker processes, and each of them steps its environments one by one.
+        An environment is reset automatically when it is done.
+
+        Args:
+            env_fn: A picklable function that creates an environment, e.g., functools.partial(gym.make, 'Pendulum-v0').
+            num_envs (int): Number of environments.
+            num_workers (int): Number of worker processes. Default is num_envs.
+                0 means the environments are stepped in the current process.
+            ctx: The multiprocessing context. Default is the "spawn" context.
+
+        """
+        if num_workers is None:
+            num_workers = num_envs
+        num_workers = min(num_workers, num_envs)
+        self._num_envs = num_envs
+        self._num_workers = num_workers
+
+        self._envs = None
+        self._conns = []
+        self._processes = []
+        self._slices = []
+        if num_workers == 0:
+            self._envs = [env_fn() for _ in range(num_envs)]
+        else:
+            if ctx is None:
+                ctx = multiprocessing.get_context('spawn')
+            start = 0
+            for i in range(num_workers):
+                size = num_envs // num_workers + (1 if i < num_envs % num_workers else 0)
+                self._slices.append(slice(start, start + size))
+                start += size
+                conn, child_conn = ctx.Pipe()
+                process = ctx.Process(target=_env_worker, args=(child_conn, env_fn, size), daemon=True)
+                process.start()
+                child_conn.close()
+                self._conns.append(conn)
+                self._processes.append(process)
+
+        self._states = None
+        self._episode_rewards = np.zeros((num_envs,), np.float64)
+        self._finished_rewards = []
+
+    @property
+    def num_envs(self):
+        return self._num_envs
+
+    @property
+    def states(self):
+        """Current states of the environments, shape (num_envs, ...).
+        """
+        return self._states
+
+    def _call(self, cmd, args_list):
+        if self._envs is not None:
+            return _env_call(self._envs, cmd, args_list)
+        for conn, s in zip(self._conns, self._slices):
+            conn.send((cmd, args_list[s] if args_list is not None else None))
+        #
+        # All the replies are received before raising, so that the pool stays in sync.
+        replies = [conn.recv() for conn in self._conns]
+        results = []
+        for ok, result in replies:
+            if not ok:
+                raise RuntimeError('Error in the environment process.\n' + result)
+            results.extend(result)
+        return results
+
+    def reset(self):
+        """Reset all the environments.
+
+        Returns:
+            numpy.ndarray: The initial states.
+
+        """
+        self._states = np.asarray(self._call('reset', None))
+        self._episode_rewards[:] = 0
+        return self._states
+
+    def step(self, actions):
+        """Step all the environments.
+
+        Args:
+            actions (numpy.ndarray): Actions, one for each environment.
+
+        Returns:
+            tuple: (states_, rewards, dones, infos). "states_" are the transition states. For the environments that
+                are done, the current states ("states" property) are the states after reset.
+
+        """
+        if self._states is None:
+            self.reset()
+        results = self._call('step', list(actions))
+        states_ = np.asarray([result[0] for result in results])
+        rewards = np.asarray([result[1] for result in results], np.float32)
+        dones = np.asarray([result[2] for result in results], np.bool_)
+        infos = [result[3] for result in results]
+        self._states = np.asarray([result[4] for result in results])
+
+        self._episode_rewards += rewards
+        for i in np.nonzero(dones)[0]:
+            self._finished_rewards.append(float(self._episode_rewards[i]))
+            self._episode_rewards[i] = 0
+        return states_, rewards, dones, infos
+
+    def pop_episode_rewards(self):
+        """Get the total rewards of the episodes finished since the last call.
+
+        Returns:
+            list[float]: Total rewards.
+
+        """
+        rewards = self._finished_rewards
+        self._finished_rewards = []
+        return rewards
+
+    def close(self):
+        if self._envs is not None:
+            _env_call(self._envs, 'close', None)
+            self._envs = None
+        for conn in self._conns:
+            try:
+                conn.send(('close', None))
+                conn.close()
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        self._conns = []
+        self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _env_call(envs, cmd, args_list):
+    if cmd == 'reset':
+        return [env.reset() for env in envs]
+    elif cmd == 'step':
+        results = []
+        for env, action in zip(envs, args_list):
+            s_, r, done, info = env.step(action)
+            s = env.reset() if done else s_
+            results.append((s_, r, done, info, s))
+        return results
+    elif cmd == 'close':
+        for env in envs:
+            if hasattr(env, 'close'):
+                env.close()
+        return None
+    raise ValueError('Unknown command %s.' % cmd)
+
+
+def _env_worker(conn, env_fn, num_envs):
+    envs = [env_fn() for _ in range(num_envs)]
+    try:
+        while True:
+            try:
+                cmd, args_list = conn.recv()
+            except EOFError:
+                break
+            try:
+                result = _env_call(envs, cmd, args_list)
+            except Exception:
+                conn.send((False, traceback.format_exc()))
+                continue
+            if cmd == 'close':
+                break
+            conn.send((True, result))
+    finally:
+        conn.close()
@@ -26,7 +26,11 @@ class DDPGAgent(ph.Model):
                  tao=0.01,
                  replay_size=10000,
                  optimizer=tf.train.RMSPropOptimizer(1e-4, 0.9, 0.9),
-                 reg_weight=1e-5):
+                 reg_weight=1e-5,
+                 prioritized=False,
+                 alpha=0.6,
+                 beta=0.4,
+                 target_update_interval=1):
         """DDPG agent.
 
         Args:
@@ -39,12 +43,20 @@ class DDPGAgent(ph.Model):
             source_critic (photinia.Widget): Source critic object.
             target_critic (photinia.Widget): Target critic object.
             gamma (float): Discount factor of reward.
-            tao (float):
+            tao (float): Soft update rate of the target networks for each train step.
             replay_size (int): Size of replay memory.
             optimizer: Optimizer to train this model.
             reg_weight (float): Weight of the regularization term.
+            prioritized (bool): Use prioritized experience replay.
+            alpha (float): Prioritization exponent of the prioritized replay.
+            beta (float): Importance sampling exponent of the prioritized replay.
+            target_update_interval (int): Number of train steps between two target updates.
+                The update rate is raised to 1 - (1 - tao)^interval, so the targets track the sources at the
+                same speed as updating every step.
 
         """
+        if not (isinstance(target_update_interval, int) and target_update_interval > 0):
+            raise ValueError('target_update_interval should be a positive integer.')
         self._input_source_state = input_source_state
         self._input_target_state = input_target_state
         self._input_reward = input_reward
@@ -57,8 +69,14 @@ class DDPGAgent(ph.Model):
         self._replay_size = replay_size
         self._optimizer = optimizer
         self._reg_weight = reg_weight
+        self._prioritized = prioritized
+        self._target_update_interval = target_update_interval
+        self._num_train_steps = 0
 
-        self._replay = common.ReplayMemory(replay_size)
+        if prioritized:
+            self._replay = common.PrioritizedReplayMemory(replay_size, alpha, beta)
+        else:
+            self._replay = common.ReplayMemory(replay_size)
         super(DDPGAgent, self).__init__(name)
 
     def _build(self):
@@ -88,37 +106,59 @@ class DDPGAgent(ph.Model):
 
         #
         # train critic
+        # The importance sampling weights are all 1 unless they are fed by the prioritized replay.
         input_reward = self._input_reward
+        input_weight = tf.placeholder_with_default(
+            tf.ones_like(input_reward),
+            shape=input_reward.shape,
+            name='input_weight'
+        )
         y = input_reward + self._gamma * target_reward
-        critic_loss = tf.reduce_mean(tf.square(y - source_reward))
+        td_error = y - source_reward
+        critic_loss = tf.reduce_mean(input_weight * tf.square(td_error))
         var_list = source_critic.get_trainable_variables()
         reg_loss = ph.reg.Regularizer().add_l1_l2(var_list).get_loss(self._reg_weight)
-        self._step_train_critic = ph.Step(
-            inputs=(input_source_state, source_action, input_reward, input_target_state),
-            outputs=critic_loss,
-            updates=self._optimizer.minimize(critic_loss + reg_loss, var_list=var_list)
-        )
+        update_critic = self._optimizer.minimize(critic_loss + reg_loss, var_list=var_list)
+        if self._prioritized:
+            self._step_train_critic = ph.Step(
+                inputs=(input_source_state, source_action, input_reward, input_target_state, input_weight),
+                outputs=(critic_loss, td_error),
+                updates=update_critic
+            )
+        else:
+            self._step_train_critic = ph.Step(
+                inputs=(input_source_state, source_action, input_reward, input_target_state),
+                outputs=critic_loss,
+                updates=update_critic
+            )
 
         #
         # train actor
         var_list = source_actor.get_trainable_variables()
         actor_loss = -tf.reduce_mean(source_reward)
         reg_loss = ph.reg.Regularizer().add_l1_l2(var_list).get_loss(self._reg_weight)
+        update_actor = self._optimizer.minimize(actor_loss + reg_loss, var_list=var_list)
         self._step_train_actor = ph.Step(
             inputs=input_source_state,
             outputs=actor_loss,
-            updates=self._optimizer.minimize(actor_loss + reg_loss, var_list=var_list)
+            updates=update_actor
         )
 
         #
         # update target networks
-        source_var_list = source_critic.get_trainable_variables() + source_actor.get_trainable_variables()
-        target_var_liet = target_critic.get_trainable_variables() + target_actor.get_trainable_variables()
+        # The variables are paired by their names relative to the widgets, and updated in place by one grouped op.
+        # The fused step also updates the targets after the actor, which saves one session run per update.
+        var_pairs = _pair_variables(source_critic, target_critic) + _pair_variables(source_actor, target_actor)
+        tao = 1.0 - (1.0 - self._tao) ** self._target_update_interval
         self._step_update_target = ph.Step(
-            updates=tf.group(*[
-                tf.assign(v_target, self._tao * v_source + (1.0 - self._tao) * v_target)
-                for v_source, v_target in zip(source_var_list, target_var_liet)
-            ])
+            updates=_soft_update(var_pairs, tao)
+        )
+        with tf.control_dependencies([update_actor]):
+            update_target = _soft_update(var_pairs, tao)
+        self._step_train_actor_update_target = ph.Step(
+            inputs=input_source_state,
+            outputs=actor_loss,
+            updates=update_target
         )
 
         #
@@ -126,7 +166,7 @@ class DDPGAgent(ph.Model):
         self._step_init_target = ph.Step(
             updates=tf.group(*[
                 tf.assign(v_target, v_source)
-                for v_source, v_target in zip(source_var_list, target_var_liet)
+                for v_source, v_target in var_pairs
             ])
         )
 
@@ -139,9 +179,94 @@ class DDPGAgent(ph.Model):
     def feedback(self, state, action, reward, state_, done=False):
         self._replay.put(state, action, reward, state_, done)
 
+    def feedback_batch(self, states, actions, rewards, states_, dones):
+        self._replay.put_batch(states, actions, rewards, states_, dones)
+
+    def explore(self, env_pool, noise=None, action_scale=1.0):
+        """Step all the environments of the pool once, and put the transitions into the replay memory.
+
+        The actions of all the environments are predicted in one session run.
+
+        Args:
+            env_pool (photinia.deep_rl.EnvPool): The environments.
+            noise (photinia.deep_rl.NormalNoise): The exploration noise.
+            action_scale: The actions are multiplied by it before they are passed to the environments.
+                The unscaled actions are stored.
+
+        Returns:
+            tuple: (rewards, dones) of the environments.
+
+        """
+        states = env_pool.states
+        if states is None:
+            states = env_pool.reset()
+        actions, = self.predict(states)
+        if noise is not None:
+            actions = noise.add_noise(actions)
+        states_, rewards, dones, _ = env_pool.step(actions * action_scale)
+        self.feedback_batch(states, actions, rewards, states_, dones)
+        return rewards, dones
+
+    @property
+    def replay(self):
+        return self._replay
+
+    @property
+    def source_actor(self):
+        return self._source_actor
+
     def train(self, batch_size):
-        state, action, reward, state_ = self._replay.get(batch_size)[:-1]
-        critic_loss, = self._step_train_critic(state, action, reward, state_)
-        actor_loss, = self._step_train_actor(state)
-        self._step_update_target()
+        if self._prioritized:
+            columns, indices, weights = self._replay.sample(batch_size)
+            state, action, reward, state_ = columns[:-1]
+            critic_loss, td_error = self._step_train_critic(state, action, reward, state_, weights)
+            self._replay.update_priorities(indices, td_error)
+        else:
+            state, action, reward, state_ = self._replay.get(batch_size)[:-1]
+            critic_loss, = self._step_train_critic(state, action, reward, state_)
+        self._num_train_steps += 1
+        if self._num_train_steps % self._target_update_interval == 0:
+            actor_loss, = self._step_train_actor_update_target(state)
+        else:
+            actor_loss, = self._step_train_actor(state)
         return critic_loss, actor_loss
+
+    def update_target(self):
+        """Soft update the target networks once.
+        """
+        self._step_update_target()
+
+
+def _pair_variables(source, target):
+    """Pair the trainable variables of the source and target widgets by their names relative to the widgets.
+
+    Args:
+        source (photinia.Widget): The source widget.
+        target (photinia.Widget): The target widget.
+
+    Returns:
+        list[tuple]: List of (source_variable, target_variable).
+
+    """
+    source_vars = {var.name[len(source.prefix):]: var for var in source.get_trainable_variables()}
+    target_vars = {var.name[len(target.prefix):]: var for var in target.get_trainable_variables()}
+    if set(source_vars.keys()) != set(target_vars.keys()):
+        raise ValueError('The variables of %s and %s do not match.' % (source.full_name, target.full_name))
+    var_pairs = []
+    for name in sorted(source_vars.keys()):
+        v_source = source_vars[name]
+        v_target = target_vars[name]
+        if not v_source.get_shape().is_compatible_with(v_target.get_shape()):
+            raise ValueError('The shapes of %s and %s do not match.' % (v_source.name, v_target.name))
+        var_pairs.append((v_source, v_target))
+    return var_pairs
+
+
+def _soft_update(var_pairs, tao):
+    """v_target <- v_target - tao * (v_target - v_source), updated in place.
+    The variables are read by read_value(), so that the reads obey the control dependencies of the caller.
+    """
+    return tf.group(*[
+        tf.assign_sub(v_target, tao * (v_target.read_value() - v_source.read_value()))
+        for v_source, v_target in var_pairs
+    ])
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+"""
+@author: xi
+@since: 2018-09-22
+"""
+
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+
+import photinia as ph
+from . import common
+
+
+class ActorLearner(object):
+
+    def __init__(self,
+                 agent,
+                 agent_fn,
+                 env_fn,
+                 state_shape,
+                 action_shape,
+                 num_actors=4,
+                 num_envs=1,
+                 noise_stddev=0.3,
+                 action_scale=1.0,
+                 chunk_size=64,
+                 num_slots=16,
+                 sync_interval=100,
+                 publish_interval=50,
+                 ctx=None):
+        """Decoupled actors and learner for DDPG.
+
+        The learner (the current process) trains the agent continuously. Each actor process builds its own copy
+        of the agent, steps its environments with the latest actor weights it has pulled, and sends the
+        transitions to the learner in chunks through a shared memory ring buffer. The weights of the source actor
+        are published by the learner through shared memory.
+
+        Args:
+            agent (photinia.deep_rl.ddpg.DDPGAgent): The agent trained by the learner.
+                Its variables should be initialized before start() is called.
+            agent_fn: A picklable function that builds the same agent in an actor process.
+            env_fn: A picklable function that creates an environment.
+            state_shape (tuple[int]): Shape of a state.
+            action_shape (tuple[int]): Shape of an action.
+            num_actors (int): Number of actor processes.
+            num_envs (int): Number of environments of each actor. They are stepped in lockstep.
+            noise_stddev (float|list[float]): Stddev of the exploration noise, or one for each actor.
+            action_scale: The actions are multiplied by it before they are passed to the environments.
+            chunk_size (int): Number of transitions sent at once.
+            num_slots (int): Number of chunks in the ring buffer.
+            sync_interval (int): Number of actor steps between two pulls of the actor weights.
+            publish_interval (int): Number of learner updates between two publications of the actor weights.
+            ctx: The multiprocessing context. Default is the "spawn" context.
+
+        """
+        if not isinstance(noise_stddev, (list, tuple)):
+            noise_stddev = [noise_stddev] * num_actors
+        if len(noise_stddev) != num_actors:
+            raise ValueError('noise_stddev should be a float or a list with one value for each actor.')
+        if ctx is None:
+            ctx = multiprocessing.get_context('spawn')
+        self._agent = agent
+        self._agent_fn = agent_fn
+        self._env_fn = env_fn
+        self._state_shape = tuple(state_shape)
+        self._action_shape = tuple(action_shape)
+        self._num_actors = num_actors
+        self._num_envs = num_envs
+        self._noise_stddev = noise_stddev
+        self._action_scale = action_scale
+        self._chunk_size = chunk_size
+        self._num_slots = num_slots
+        self._sync_interval = sync_interval
+        self._publish_interval = publish_interval
+        self._ctx = ctx
+
+        self._ring = None
+        self._params = None
+        self._env_steps = None
+        self._stop_event = None
+        self._processes = []
+
+        self._num_updates = 0
+        self._episode_rewards = []
+        self._last_time = None
+        self._last_updates = 0
+        self._last_env_steps = 0
+
+    def start(self):
+        """Create the shared memory and start the actor processes.
+        """
+        if len(self._processes) > 0:
+            raise RuntimeError('The actors have been started.')
+        ctx = self._ctx
+        self._ring = ph.io.SharedRingBuffer(
+            ('s', 'a', 'r', 's_', 'done'),
+            self._chunk_size,
+            (self._state_shape, self._action_shape, (), self._state_shape, ()),
+            (np.float32, np.float32, np.float32, np.float32, np.bool_),
+            num_slots=self._num_slots,
+            ctx=ctx
+        )
+        self._params = ph.SharedParameters(self._agent.source_actor.get_parameters(), ctx)
+        self._env_steps = ctx.RawArray('q', self._num_actors)
+        self._stop_event = ctx.Event()
+        for rank in range(self._num_actors):
+            process = ctx.Process(
+                target=_run_actor,
+                args=(
+                    rank, self._agent_fn, self._env_fn, self._num_envs,
+                    self._noise_stddev[rank], self._action_scale, self._sync_interval,
+                    self._ring, self._params, self._env_steps, self._stop_event
+                ),
+                daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+        self._last_time = time.time()
+
+    def stop(self):
+        """Stop the actor processes.
+        """
+        if len(self._processes) == 0:
+            return
+        self._stop_event.set()
+        #
+        # Release the chunks so that the blocked actors can see the stop event.
+        while True:
+            try:
+                slot, _, _ = self._ring.get(timeout=0.1)
+            except queue.Empty:
+                break
+            self._ring.release(slot)
+        for process in self._processes:
+            process.join(10)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def num_updates(self):
+        return self._num_updates
+
+    @property
+    def num_env_steps(self):
+        return int(np.sum(self._env_steps)) if self._env_steps is not None else 0
+
+    def _receive(self, block):
+        """Move the ready chunks into the replay memory.
+        """
+        num_chunks = 0
+        while True:
+            try:
+                if block and num_chunks == 0:
+                    slot, columns, episode_rewards = self._ring.get(timeout=0.1)
+                else:
+                    slot, columns, episode_rewards = self._ring.get(block=False)
+            except queue.Empty:
+                return num_chunks
+            try:
+                self._agent.feedback_batch(*columns)
+            finally:
+                self._ring.release(slot)
+            self._episode_rewards.extend(episode_rewards)
+            num_chunks += 1
+
+    def _check_actors(self):
+        for process in self._processes:
+            if not process.is_alive():
+                raise RuntimeError('Actor process exited unexpectedly with code %s.' % process.exitcode)
+
+    def publish(self):
+        """Publish the weights of the source actor to the actors.
+        """
+        params = self._params
+        params.write(params.flatten(self._agent.source_actor.get_parameters()))
+
+    def run(self, num_updates, batch_size, min_replay_size=None, callback=None, report_interval=1000):
+        """Train the agent with the transitions sent by the actors.
+
+        Args:
+            num_updates (int): Number of updates (train steps).
+            batch_size (int): Batch size.
+            min_replay_size (int): Training starts after the replay memory has this number of transitions.
+                Default is batch_size.
+            callback ((dict) -> None): Called with stats() every "report_interval" updates.
+            report_interval (int): Number of updates between two callbacks.
+
+        Returns:
+            dict: The stats of the last interval.
+
+        """
+        if len(self._processes) == 0:
+            raise RuntimeError('start() should be called before run().')
+        if min_replay_size is None:
+            min_replay_size = batch_size
+        replay = self._agent.replay
+
+        while len(replay) < min_replay_size:
+            if self._receive(block=True) == 0:
+                self._check_actors()
+
+        for i in range(num_updates):
+            self._receive(block=False)
+            self._agent.train(batch_size)
+            self._num_updates += 1
+            if self._num_updates % self._publish_interval == 0:
+                self.publish()
+            if callback is not None and (i + 1) % report_interval == 0:
+                self._check_actors()
+                callback(self.stats())
+        return self.stats()
+
+    def stats(self):
+        """Get the throughput since the last call, and the rewards of the episodes finished since the last call.
+
+        Returns:
+            dict: Keys are "updates", "env_steps", "updates_per_sec", "env_steps_per_sec" and "episode_rewards".
+
+        """
+        now = time.time()
+        num_env_steps = self.num_env_steps
+        duration = max(now - self._last_time, 1e-9) if self._last_time is not None else float('inf')
+        stats = {
+            'updates': self._num_updates,
+            'env_steps': num_env_steps,
+            'updates_per_sec': (self._num_updates - self._last_updates) / duration,
+            'env_steps_per_sec': (num_env_steps - self._last_env_steps) / duration,
+            'episode_rewards': self._episode_rewards
+        }
+        self._last_time = now
+        self._last_updates = self._num_updates
+        self._last_env_steps = num_env_steps
+        self._episode_rewards = []
+        return stats
+
+
+def _run_actor(rank,
+               agent_fn,
+               env_fn,
+               num_envs,
+               noise_stddev,
+               action_scale,
+               sync_interval,
+               ring,
+               params,
+               env_steps,
+               stop_event):
+    np.random.seed((int(time.time() * 1000) + rank) % (2 ** 32))
+    env_pool = common.EnvPool(env_fn, num_envs, num_workers=0)
+    agent = agent_fn()
+    ph.initialize_global_variables()
+    actor = agent.source_actor
+    noise = common.NormalNoise(noise_stddev)
+    chunk_size = ring.batch_size
+
+    rows = []
+    episode_rewards = []
+    num_steps = 0
+    env_pool.reset()
+    while not stop_event.is_set():
+        if num_steps % sync_interval == 0:
+            flat, _ = params.read()
+            actor.set_parameters(params.unflatten(flat))
+        num_steps += 1
+
+        states = env_pool.states
+        actions, = agent.predict(states)
+        actions = noise.add_noise(actions)
+        states_, rewards, dones, _ = env_pool.step(actions * action_scale)
+        rows.extend(zip(states, actions, rewards, states_, dones))
+        env_steps[rank] += num_envs
+        episode_rewards.extend(env_pool.pop_episode_rewards())
+
+        while len(rows) >= chunk_size and not stop_event.is_set():
+            columns = tuple(np.asarray(column) for column in zip(*rows[:chunk_size]))
+            try:
+                ring.put(columns, episode_rewards, timeout=0.1)
+            except queue.Empty:
+                continue
+            rows = rows[chunk_size:]
+            episode_rewards = []
+    env_pool.close()
@@ -6,9 +6,14 @@
 """
 
 import collections
+import concurrent.futures
 import csv
+import json
+import multiprocessing
+import os
 import queue
 import random
+import struct
 import threading
 import time
 
@@ -40,19 +45,33 @@ class MemorySource(DataSource):
     def __init__(self,
                  columns,
                  column_names,
-                 dtype=None):
+                 dtype=None,
+                 index_shuffle=False):
         """Data source from memory.
 
+        In the index shuffling mode, the columns are never reordered. Instead, a permutation of the
+        row indices is shuffled for each epoch, and the batches are gathered by the permuted indices
+        into preallocated arrays. Thus no copy of the whole dataset is made, but the arrays returned
+        by next_batch() are reused (overwritten) by the next call.
+
         Args:
             columns: Tuple of list, np.array or any iterable objects.
             column_names (tuple|list): Column names.
             dtype: Data type.
+            index_shuffle (bool): Use the index shuffling mode.
         """
+        self._init_columns(
+            [np.array(column, dtype=dtype) for column in columns],
+            column_names,
+            index_shuffle
+        )
+
+    def _init_columns(self, columns, column_names, index_shuffle):
         self._num_comp = len(columns)
         if self._num_comp == 0:
             raise ValueError('At least 1 data object should be given.')
         self._meta = tuple(str(column_name) for column_name in column_names)
-        self._columns = [np.array(column, dtype=dtype) for column in columns]
+        self._columns = columns
         size = None
         for column in self._columns:
             if size is None:
@@ -64,6 +83,10 @@ class MemorySource(DataSource):
         self._start = 0
         self._loop = 0
 
+        self._index_shuffle = index_shuffle
+        self._perm = np.arange(self._size) if index_shuffle else None
+        self._buffers = None
+
     @property
     def size(self):
         return self._size
@@ -85,14 +108,17 @@ class MemorySource(DataSource):
             self._loop += 1
             self.shuffle()
             return None
+        index = self._perm[self._start] if self._index_shuffle else self._start
         row = tuple(
-            column[self._start]
+            column[index]
             for column in self._columns
         )
         self._start += 1
         return row
 
     def next_batch(self, size=0):
+        if self._index_shuffle and size > 0:
+            return self._gather(self._next_indices(size))
         batch = self._next_batch(size)
         if size == 0:
             return batch
@@ -118,7 +144,40 @@ class MemorySource(DataSource):
             self._loop += 1
         return batch
 
+    def _next_indices(self, size):
+        index_list = list()
+        real_size = 0
+        while real_size < size:
+            if self._start == 0 and self._loop != 0:
+                self.shuffle()
+            end = min(self._start + size - real_size, self._size)
+            index_list.append(self._perm[self._start:end])
+            real_size += end - self._start
+            if end < self._size:
+                self._start = end
+            else:
+                self._start = 0
+                self._loop += 1
+        return index_list[0] if len(index_list) == 1 else np.concatenate(index_list)
+
+    def _gather(self, indices):
+        size = len(indices)
+        if self._buffers is None or len(self._buffers[0]) != size:
+            self._buffers = tuple(
+                np.empty((size, *column.shape[1:]), dtype=column.dtype)
+                for column in self._columns
+            )
+        for column, buffer in zip(self._columns, self._buffers):
+            np.take(column, indices, axis=0, out=buffer)
+        return self._buffers
+
     def shuffle(self, num=3):
+        if self._index_shuffle:
+            #
+            # A new permutation array is created instead of shuffling in place,
+            # since the batch being gathered may still refer to the old one.
+            self._perm = np.random.permutation(self._size)
+            return self
         perm = np.arange(self._size)
         for _ in range(num):
             np.random.shuffle(perm)
@@ -130,6 +189,197 @@ class MemorySource(DataSource):
         return self._columns
 
 
+class MmapWriter(object):
+
+    def __init__(self, output_dir, column_names):
+        """Writer of the memory-mapped dataset format.
+
+        The dataset is stored in a directory. Each column is stored in a ".npy" file, and a
+        "header.json" file records the column names (meta), the number of rows, and the data type
+        and cell shape of each column. The data type and shape of a column are decided by its first
+        cell, and object columns are not supported.
+
+        Args:
+            output_dir (str): The output directory. It will be created if not exists.
+            column_names (tuple|list): Column names.
+
+        """
+        self._output_dir = output_dir
+        self._meta = tuple(str(column_name) for column_name in column_names)
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self._files = None
+        self._dtypes = None
+        self._shapes = None
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def size(self):
+        return self._size
+
+    def meta(self):
+        return self._meta
+
+    def write(self, row):
+        """Write a row.
+
+        Args:
+            row (tuple|list): The row.
+
+        """
+        self.write_batch(tuple([cell] for cell in row))
+
+    def write_batch(self, columns):
+        """Write a batch of rows.
+
+        Args:
+            columns (tuple|list): Columns of the batch.
+
+        """
+        if len(columns) != len(self._meta):
+            raise ValueError('The batch should have %d columns.' % len(self._meta))
+        if self._files is None:
+            self._open([np.asarray(column[0]) for column in columns])
+        size = None
+        for i, column in enumerate(columns):
+            column = np.asarray(column, dtype=self._dtypes[i])
+            if column.shape[1:] != self._shapes[i]:
+                raise ValueError(
+                    'Invalid cell shape %s for column %s. %s expected.' % (
+                        str(column.shape[1:]), self._meta[i], str(self._shapes[i])
+                    )
+                )
+            if size is None:
+                size = len(column)
+            elif len(column) != size:
+                raise ValueError('All columns must have the same size.')
+            self._files[i].write(np.ascontiguousarray(column).tobytes())
+        self._size += size
+
+    def _open(self, cells):
+        self._dtypes = list()
+        self._shapes = list()
+        self._files = list()
+        for i, cell in enumerate(cells):
+            if cell.dtype.hasobject:
+                raise ValueError('Column %s has an object data type which is not supported.' % self._meta[i])
+            self._dtypes.append(cell.dtype)
+            self._shapes.append(cell.shape)
+            f = open(os.path.join(self._output_dir, _MMAP_COLUMN_FILE % i), 'wb')
+            f.write(_npy_header(cell.dtype, (0, *cell.shape)))
+            self._files.append(f)
+
+    def close(self):
+        """Finish writing. The ".npy" headers and the "header.json" file are written here.
+        """
+        columns = list()
+        if self._files is not None:
+            for i, f in enumerate(self._files):
+                shape = (self._size, *self._shapes[i])
+                f.seek(0)
+                f.write(_npy_header(self._dtypes[i], shape))
+                f.close()
+                columns.append({
+                    'file': _MMAP_COLUMN_FILE % i,
+                    'dtype': self._dtypes[i].str,
+                    'shape': list(self._shapes[i])
+                })
+            self._files = None
+        header = {
+            'meta': list(self._meta),
+            'size': self._size,
+            'columns': columns
+        }
+        with open(os.path.join(self._output_dir, _MMAP_HEADER_FILE), 'w') as f:
+            json.dump(header, f, indent=4)
+
+
+_MMAP_HEADER_FILE = 'header.json'
+_MMAP_COLUMN_FILE = 'column_%d.npy'
+_NPY_HEADER_SIZE = 256
+
+
+def _npy_header(dtype, shape):
+    """Make a ".npy" (version 1.0) header with a fixed size,
+    so that it can be rewritten when the number of rows is known.
+    """
+    header = repr({
+        'descr': np.lib.format.dtype_to_descr(dtype),
+        'fortran_order': False,
+        'shape': tuple(shape)
+    })
+    header = header.ljust(_NPY_HEADER_SIZE - 11) + '\n'
+    if len(header) != _NPY_HEADER_SIZE - 10:
+        raise ValueError('The header of shape %s is too long.' % str(shape))
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def dump_source_as_mmap(source, output_dir):
+    """Dump all rows of a data source (in one epoch) into the memory-mapped dataset format.
+
+    Args:
+        source (DataSource): The data source.
+            If it is a BatchSource with positive batch size, each result of next() is written as a batch.
+        output_dir (str): The output directory.
+
+    Returns:
+        int: Number of rows written.
+
+    """
+    is_batch = isinstance(source, BatchSource) and source.batch_size
+    with MmapWriter(output_dir, source.meta()) as writer:
+        while True:
+            item = source.next()
+            if item is None:
+                break
+            if is_batch:
+                writer.write_batch(item)
+            else:
+                writer.write(item)
+        return writer.size
+
+
+class MmapSource(MemorySource):
+
+    def __init__(self, input_dir, random_order=True):
+        """Data source from the memory-mapped dataset format (written by MmapWriter).
+
+        The columns are memory-mapped, so the data are read from the page cache rather
+        than loaded into memory. The index shuffling mode of MemorySource is always used.
+        The rows of a batch are read in ascending order of their positions in the files.
+
+        Args:
+            input_dir (str): The dataset directory.
+            random_order (bool): If iterate the dataset in random order.
+
+        """
+        with open(os.path.join(input_dir, _MMAP_HEADER_FILE), 'r') as f:
+            header = json.load(f)
+        columns = [
+            np.load(os.path.join(input_dir, column['file']), mmap_mode='r')
+            if header['size'] > 0 else
+            np.empty((0, *column['shape']), np.dtype(column['dtype']))
+            for column in header['columns']
+        ]
+        self._random_order = random_order
+        self._init_columns(columns, header['meta'], True)
+        self.shuffle()
+
+    def shuffle(self, num=3):
+        if self._random_order:
+            super(MmapSource, self).shuffle(num)
+        return self
+
+    def _gather(self, indices):
+        return super(MmapSource, self)._gather(np.sort(indices))
+
+
 class CSVSource(DataSource):
 
     def __init__(self, fp, column_names, delimiter=','):
@@ -165,6 +415,168 @@ class CSVSource(DataSource):
         return self._memory_source.next()
 
 
+class CSVStreamSource(DataSource):
+
+    def __init__(self,
+                 csv_file,
+                 column_names,
+                 dtypes=None,
+                 converters=None,
+                 delimiter=',',
+                 encoding='utf-8',
+                 chunk_size=10000,
+                 shuffle_buffer_size=0,
+                 byte_range=None):
+        """Data source that streams a CSV file.
+
+        Unlike CSVSource, the file is read again in each epoch and nothing is cached. The lines are
+        parsed in chunks, and each column of a chunk is converted into a typed NumPy array.
+        The first line of the file should be the header.
+
+        The file can be split into disjoint byte ranges (see split_ranges()), so that multiple workers
+        can read different parts of the same file. A line belongs to the range containing its first
+        byte. Note that quoted cells containing line breaks are not supported.
+
+        Args:
+            csv_file (str): Path of the CSV file.
+            column_names (tuple|list): Column names.
+            dtypes (dict[str, Any]): NumPy data type for each column. Columns not given are kept as str.
+            converters (dict[str, (str) -> Any]): Function to convert the cells for each column.
+                The converter is applied before the data type conversion.
+            delimiter (str): Delimiter of the CSV file.
+            encoding (str): Encoding of the CSV file.
+            chunk_size (int): Number of lines parsed at a time.
+            shuffle_buffer_size (int): Size of the shuffle buffer. If positive, the rows are approximately
+                shuffled by randomly drawing from a buffer of this size.
+            byte_range (tuple[int]): (start, end) byte offsets to read. Default is the whole file.
+
+        """
+        self._csv_file = csv_file
+        self._meta = tuple(column_name for column_name in column_names)
+        dtypes = dtypes if dtypes is not None else {}
+        self._dtypes = [dtypes.get(column_name) for column_name in self._meta]
+        converters = converters if converters is not None else {}
+        self._converters = [converters.get(column_name) for column_name in self._meta]
+        self._delimiter = delimiter
+        self._encoding = encoding
+        if isinstance(chunk_size, int) and chunk_size > 0:
+            self._chunk_size = chunk_size
+        else:
+            raise ValueError('Argument chunk_size should be a positive integer.')
+        self._shuffle_buffer_size = shuffle_buffer_size
+
+        with open(csv_file, 'rb') as f:
+            header = next(csv.reader([f.readline().decode(encoding)], delimiter=delimiter))
+            self._data_start = f.tell()
+            file_size = f.seek(0, os.SEEK_END)
+        try:
+            self._indices = [header.index(column_name) for column_name in self._meta]
+        except ValueError:
+            raise ValueError('Some of the columns %s are not in the file.' % str(self._meta))
+        if byte_range is None:
+            byte_range = (self._data_start, file_size)
+        self._start, self._end = byte_range
+
+        self._file = None
+        self._chunk = None
+        self._chunk_index = 0
+        self._buffer = list()
+        self._eof = False
+
+    @staticmethod
+    def split_ranges(csv_file, num_parts):
+        """Split the data part (without the header) of a CSV file into disjoint byte ranges.
+
+        Args:
+            csv_file (str): Path of the CSV file.
+            num_parts (int): Number of ranges.
+
+        Returns:
+            list[tuple[int]]: List of (start, end) byte offsets.
+
+        """
+        with open(csv_file, 'rb') as f:
+            f.readline()
+            data_start = f.tell()
+            file_size = f.seek(0, os.SEEK_END)
+        bounds = np.linspace(data_start, file_size, num_parts + 1).astype(np.int64)
+        return [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:])]
+
+    def meta(self):
+        return self._meta
+
+    def next(self):
+        if self._shuffle_buffer_size <= 0:
+            return self._next_row()
+        while not self._eof and len(self._buffer) < self._shuffle_buffer_size:
+            row = self._next_row()
+            if row is None:
+                self._eof = True
+                break
+            self._buffer.append(row)
+        if len(self._buffer) == 0:
+            self._eof = False
+            return None
+        #
+        # Swap a random row to the end of the buffer, then pop it.
+        index = random.randint(0, len(self._buffer) - 1)
+        self._buffer[index], self._buffer[-1] = self._buffer[-1], self._buffer[index]
+        return self._buffer.pop()
+
+    def _next_row(self):
+        if self._chunk is None or self._chunk_index >= len(self._chunk[0]):
+            self._chunk = self._read_chunk()
+            self._chunk_index = 0
+            if self._chunk is None:
+                return None
+        row = tuple(
+            column[self._chunk_index]
+            for column in self._chunk
+        )
+        self._chunk_index += 1
+        return row
+
+    def _read_chunk(self):
+        if self._file is None:
+            self._file = open(self._csv_file, 'rb')
+            if self._start > self._data_start:
+                #
+                # Skip the line started in the previous range.
+                self._file.seek(self._start - 1)
+                self._file.readline()
+            else:
+                self._file.seek(self._data_start)
+        lines = list()
+        while len(lines) < self._chunk_size and self._file.tell() < self._end:
+            line = self._file.readline()
+            if not line:
+                break
+            line = line.decode(self._encoding)
+            if line.strip() == '':
+                continue
+            lines.append(line)
+        if len(lines) == 0:
+            self._file.close()
+            self._file = None
+            return None
+        columns = tuple(list() for _ in self._meta)
+        for record in csv.reader(lines, delimiter=self._delimiter):
+            for column, index in zip(columns, self._indices):
+                column.append(record[index])
+        return tuple(
+            self._convert_column(column, dtype, converter)
+            for column, dtype, converter in zip(columns, self._dtypes, self._converters)
+        )
+
+    @staticmethod
+    def _convert_column(column, dtype, converter):
+        if converter is not None:
+            column = [converter(cell) for cell in column]
+        if dtype is not None:
+            return np.array(column).astype(dtype)
+        return np.array(column)
+
+
 class MongoSource(DataSource):
 
     def __init__(self,
@@ -172,16 +584,25 @@ class MongoSource(DataSource):
                  column_names,
                  filters,
                  random_order,
-                 buffer_size=100000):
+                 buffer_size=100000,
+                 fetch_size=256,
+                 num_fetchers=4):
         """Data source used to access MongoDB.
 
+        In random order mode, the ids of the matched documents are fetched only once and kept in a
+        compact local array, which is shuffled at the beginning of each epoch. The documents are then
+        fetched in batches by "$in" queries, with several requests in flight at the same time.
+
         Args:
             coll: MongoDB collection object.
             column_names (list[str]|tuple[str]): Column names that will query from the database.
             filters (dict): Filters which will be pass to MongoDB's find() operation.
             random_order (bool): If iterate the collections in random order.
                 This is usually set to True when used as train set.
-            buffer_size (int): Max size of the candidate buffer.
+            buffer_size (int): Deprecated. The candidate buffer has been replaced by the local id array.
+            fetch_size (int): Number of documents fetched by one request.
+                This option will only take effect when random_order is True.
+            num_fetchers (int): Number of threads fetching the documents.
                 This option will only take effect when random_order is True.
 
         """
@@ -192,9 +613,23 @@ class MongoSource(DataSource):
         self._projections = {column_name: 1 for column_name in column_names}
         self._filters = filters if filters is not None else {}
         self._buffer_size = buffer_size
+        if isinstance(fetch_size, int) and fetch_size > 0:
+            self._fetch_size = fetch_size
+        else:
+            raise ValueError('Argument fetch_size should be a positive integer.')
+        if isinstance(num_fetchers, int) and num_fetchers > 0:
+            self._num_fetchers = num_fetchers
+        else:
+            raise ValueError('Argument num_fetchers should be a positive integer.')
 
         self._cursor = None
-        self._buffer = list()
+
+        self._ids = None
+        self._id_type = None
+        self._id_start = 0
+        self._executor = None
+        self._futures = collections.deque()
+        self._docs = collections.deque()
 
     def meta(self):
         return self._meta
@@ -210,56 +645,76 @@ class MongoSource(DataSource):
         ) if doc is not None else None
 
     def _random_next(self):
-        _id = None
-        error = None
-        for _ in range(3):
-            try:
-                _id = self._next_id()
-                break
-            except StopIteration:
+        if self._ids is None:
+            self._load_ids()
+            np.random.shuffle(self._ids)
+            self._executor = concurrent.futures.ThreadPoolExecutor(self._num_fetchers)
+        while len(self._docs) == 0:
+            while len(self._futures) < 2 * self._num_fetchers and self._id_start < len(self._ids):
+                end = self._id_start + self._fetch_size
+                ids = self._decode_ids(self._ids[self._id_start:end])
+                self._futures.append(self._executor.submit(self._fetch_docs, ids))
+                self._id_start = end
+            if len(self._futures) == 0:
+                #
+                # The end of the epoch.
+                self._id_start = 0
+                np.random.shuffle(self._ids)
                 return None
-            except Exception as e:
-                error = e
-                time.sleep(3)
-                continue
-        if _id is None:
-            raise error
+            self._docs.extend(self._futures.popleft().result())
+        return self._docs.popleft()
 
-        if len(self._buffer) < self._buffer_size:
-            self._buffer.append(_id)
+    def _load_ids(self):
+        """Load the ids of all matched documents.
+        If all the ids are ObjectIds, they are stored as a 12 bytes array.
+        """
+        id_type = None
+        binary = bytearray()
+        ids = None
+        for doc in self._coll.find(self._filters, {'_id': 1}):
+            _id = doc['_id']
+            if ids is None:
+                if id_type is None and isinstance(getattr(_id, 'binary', None), bytes) and len(_id.binary) == 12:
+                    id_type = type(_id)
+                if id_type is not None and type(_id) is id_type:
+                    binary += _id.binary
+                    continue
+                ids = self._decode_ids(np.frombuffer(binary, dtype='V12'), id_type) if len(binary) > 0 else []
+            ids.append(_id)
+        if ids is None:
+            self._id_type = id_type
+            self._ids = np.frombuffer(binary, dtype='V12')
         else:
-            index = random.randint(0, self._buffer_size - 1)
-            self._buffer[index] = _id
-        index = random.randint(0, len(self._buffer) - 1)
-        _id = self._buffer[index]
-
-        doc = None
+            self._id_type = None
+            self._ids = np.empty((len(ids),), dtype=object)
+            self._ids[:] = ids
+
+    def _decode_ids(self, ids, id_type=None):
+        if id_type is None:
+            id_type = self._id_type
+        if id_type is None:
+            return list(ids)
+        binary = ids.tobytes()
+        return [id_type(binary[i:i + 12]) for i in range(0, len(binary), 12)]
+
+    def _fetch_docs(self, ids):
+        """This method is executed in the fetcher threads!
+        The returned documents are in the same order as the ids.
+        """
+        docs = None
         error = None
         for _ in range(3):
             try:
-                doc = self._coll.find_one({'_id': _id}, self._projections)
+                docs = list(self._coll.find({'_id': {'$in': ids}}, self._projections))
                 break
             except Exception as e:
                 error = e
                 time.sleep(3)
                 continue
-        if doc is None:
+        if docs is None:
             raise error
-
-        return doc
-
-    def _next_id(self):
-        if self._cursor is None:
-            self._cursor = self._coll.find(self._filters, {'_id': 1})
-        try:
-            doc = next(self._cursor)
-        except StopIteration as e:
-            self._cursor = None
-            raise e
-        except Exception as e:
-            self._cursor = None
-            raise e
-        return doc['_id']
+        doc_dict = {doc['_id']: doc for doc in docs}
+        return [doc_dict[_id] for _id in ids if _id in doc_dict]
 
     def _normal_order(self):
         doc = None
@@ -304,6 +759,7 @@ class BatchSource(DataSource):
 
         self._cell_fns = collections.defaultdict(collections.deque)
         self._column_fns = collections.defaultdict(collections.deque)
+        self._vectorized_fns = collections.defaultdict(collections.deque)
 
         self._eof = False
 
@@ -331,35 +787,85 @@ class BatchSource(DataSource):
         for item in column_name:
             self._column_fns[item] += fns
 
+    def add_vectorized_fns(self, column_name, fns):
+        """Add vectorized mappers to the column(s).
+
+        Unlike the column mappers which receive the column as a Python list, a vectorized mapper
+        receives the column of the whole batch stacked into one NumPy array (shaped (batch_size, ...)).
+        If the cells have different shapes, the mapper receives a 1-D object array of the cells instead,
+        which can be turned into a dense array by PadMapper.
+        Vectorized mappers are applied after the cell mappers and the column mappers.
+
+        Args:
+            column_name (str|list[str]): Column name(s).
+            fns: Callable or list(tuple) of callables, e.g., instances of ColumnMapper.
+
+        """
+        if callable(fns):
+            fns = [fns]
+        elif not isinstance(fns, (list, tuple)):
+            raise ValueError('fns should be callable or list(tuple) of callables.')
+        if type(column_name) is not list:
+            column_name = [column_name]
+        for item in column_name:
+            self._vectorized_fns[item] += fns
+
     def meta(self):
         return self._meta
 
     def next(self):
         if self._batch_size:
-            if self._eof:
-                self._eof = False
+            rows = self._read_rows()
+            if rows is None:
                 return None
-            columns = tuple(list() for _ in self._meta)
-            for i in range(self._batch_size):
-                row = self._next_one()
-                if isinstance(row, Exception):
-                    raise row
-                if row is None:
-                    if i == 0:
-                        return None
-                    else:
-                        self._eof = True
-                        break
-                for j, cell in enumerate(row):
-                    columns[j].append(cell)
-            columns = tuple(
-                self._apply_batch_mappers(column_name, column)
-                for column_name, column in zip(self._meta, columns)
-            )
-            return columns
+            return self._map_rows(rows)
         else:
             return self._next_one()
 
+    def _read_rows(self):
+        """Read the raw rows of the next batch from the input source.
+
+        Returns:
+            list[tuple]: List of rows. None if the epoch ends.
+
+        """
+        if self._eof:
+            self._eof = False
+            return None
+        rows = list()
+        for i in range(self._batch_size):
+            row = self._input_source.next()
+            if isinstance(row, Exception):
+                raise row
+            if row is None:
+                if i == 0:
+                    return None
+                else:
+                    self._eof = True
+                    break
+            rows.append(row)
+        return rows
+
+    def _map_rows(self, rows):
+        """Apply the cell mappers and the column mappers to the raw rows.
+
+        Args:
+            rows (list[tuple]): Raw rows read from the input source.
+
+        Returns:
+            tuple: Columns of the batch.
+
+        """
+        columns = tuple(list() for _ in self._meta)
+        for row in rows:
+            for j, column_name in enumerate(self._meta):
+                columns[j].append(self._apply_column_mappers(row[j], column_name))
+        columns = tuple(
+            self._apply_batch_mappers(column_name, column)
+            for column_name, column in zip(self._meta, columns)
+        )
+        return columns
+
     def _next_one(self):
         row = self._input_source.next()
         if row is None:
@@ -380,9 +886,133 @@ class BatchSource(DataSource):
         if column_name in self._column_fns:
             for fn in self._column_fns[column_name]:
                 column = fn(column)
+        if column_name in self._vectorized_fns:
+            column = _stack_cells(column)
+            for fn in self._vectorized_fns[column_name]:
+                column = fn(column)
+        return column
+
+
+def _stack_cells(cells):
+    """Stack the cells into one array.
+    If the cells have different shapes, a 1-D object array is returned.
+    """
+    if isinstance(cells, np.ndarray):
+        return cells
+    try:
+        return np.stack(cells)
+    except ValueError:
+        array = np.empty((len(cells),), dtype=object)
+        for i, cell in enumerate(cells):
+            array[i] = cell
+        return array
+
+
+class ColumnMapper(object):
+    """Vectorized column mapper
+    """
+
+    def __call__(self, column):
+        raise NotImplementedError()
+
+
+class CastMapper(ColumnMapper):
+
+    def __init__(self, dtype):
+        """Convert the column to the given data type.
+
+        Args:
+            dtype: NumPy data type.
+
+        """
+        self._dtype = dtype
+
+    def __call__(self, column):
+        return np.asarray(column, dtype=self._dtype)
+
+
+class OneHotMapper(ColumnMapper):
+
+    def __init__(self, dims, dtype=np.float32):
+        """Convert the index column into one hot vectors.
+
+        Args:
+            dims (int): Dimension of the one hot vector.
+            dtype: NumPy data type.
+
+        """
+        self._dims = dims
+        self._dtype = dtype
+
+    def __call__(self, column):
+        column = np.asarray(column, dtype=np.int64)
+        ret = np.zeros((column.size, self._dims), dtype=self._dtype)
+        ret[np.arange(column.size), column.ravel()] = 1
+        return ret.reshape((*column.shape, self._dims))
+
+
+class NormalizeMapper(ColumnMapper):
+
+    def __init__(self, mean=None, std=None, eps=1e-7, dtype=np.float32):
+        """Normalize the column as (x - mean) / std.
+
+        Args:
+            mean: Mean value(s) broadcastable to a cell. If None, the mean of the batch is used.
+            std: Standard deviation(s) broadcastable to a cell. If None, the std of the batch is used.
+            eps (float): Small value added to std.
+            dtype: NumPy data type.
+
+        """
+        self._mean = mean
+        self._std = std
+        self._eps = eps
+        self._dtype = dtype
+
+    def __call__(self, column):
+        column = np.asarray(column, dtype=self._dtype)
+        mean = self._mean if self._mean is not None else np.mean(column, axis=0)
+        std = self._std if self._std is not None else np.std(column, axis=0)
+        column = column - mean
+        column /= std + self._eps
         return column
 
 
+class PadMapper(ColumnMapper):
+
+    def __init__(self, length=None, value=0, dtype=None):
+        """Pad (or truncate) the sequences of the column to the same length.
+
+        Args:
+            length (int): The target length. If None, the max length of the batch is used.
+            value: Padding value.
+            dtype: NumPy data type. If None, the data type of the first sequence is used.
+
+        """
+        self._length = length
+        self._value = value
+        self._dtype = dtype
+
+    def __call__(self, column):
+        if column.dtype != object:
+            #
+            # The sequences already have the same length.
+            length = self._length if self._length is not None else column.shape[1]
+            dtype = self._dtype if self._dtype is not None else column.dtype
+            ret = np.full((len(column), length, *column.shape[2:]), self._value, dtype=dtype)
+            size = min(length, column.shape[1])
+            ret[:, :size] = column[:, :size]
+            return ret
+        seqs = [np.asarray(seq) for seq in column]
+        length = self._length if self._length is not None else max(len(seq) for seq in seqs)
+        first = seqs[0]
+        dtype = self._dtype if self._dtype is not None else first.dtype
+        ret = np.full((len(seqs), length, *first.shape[1:]), self._value, dtype=dtype)
+        for i, seq in enumerate(seqs):
+            seq = seq[:length]
+            ret[i, :len(seq)] = seq
+        return ret
+
+
 class ThreadBufferedSource(DataSource):
 
     def __init__(self, input_source, buffer_size=1000):
@@ -442,3 +1072,406 @@ class ThreadBufferedSource(DataSource):
         # if not self._main_thread.is_alive():
         #     break
         # print('DEBUG: Loading thread stopped. %d loaded' % (i + 1))
+
+
+class SharedRingBuffer(object):
+
+    def __init__(self,
+                 meta,
+                 batch_size,
+                 shapes,
+                 dtypes,
+                 num_slots=8,
+                 ctx=None):
+        """Ring buffer of preallocated batches in shared memory.
+
+        Each slot of the buffer holds one batch with a fixed column layout, i.e., the cells of a column
+        have the same shape and data type. A producer writes a batch into a free slot, and a consumer
+        reads the batch as NumPy arrays which are views of the shared memory (no copying, no pickling).
+        The buffer should be created before the producer/consumer processes are started.
+
+        Args:
+            meta (tuple[str]|list[str]): Column names, usually given by DataSource.meta().
+            batch_size (int): Max number of rows in one slot.
+            shapes (dict[str, tuple]|list[tuple]|tuple[tuple]): Shape of one cell for each column.
+            dtypes (dict[str, Any]|list|tuple): NumPy data type for each column.
+            num_slots (int): Number of slots.
+            ctx: The multiprocessing context of the producer/consumer processes. Default is the default context.
+
+        """
+        if ctx is None:
+            ctx = multiprocessing.get_context()
+        self._meta = tuple(meta)
+        if isinstance(batch_size, int) and batch_size > 0:
+            self._batch_size = batch_size
+        else:
+            raise ValueError('Argument batch_size should be a positive integer.')
+        if isinstance(num_slots, int) and num_slots > 1:
+            self._num_slots = num_slots
+        else:
+            raise ValueError('Argument num_slots should be an integer greater than 1.')
+        if isinstance(shapes, dict):
+            shapes = [shapes[column_name] for column_name in self._meta]
+        if isinstance(dtypes, dict):
+            dtypes = [dtypes[column_name] for column_name in self._meta]
+        if len(shapes) != len(self._meta) or len(dtypes) != len(self._meta):
+            raise ValueError('The numbers of shapes and dtypes should be the same as the number of columns.')
+        #
+        # Layout of one slot. Each column starts at an offset aligned to 64 bytes.
+        self._layout = list()
+        offset = 0
+        for shape, dtype in zip(shapes, dtypes):
+            shape = (self._batch_size, *shape)
+            dtype = np.dtype(dtype)
+            self._layout.append((offset, shape, dtype.str))
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            offset += (nbytes + 63) // 64 * 64
+        self._slot_size = offset
+
+        self._slots = [
+            ctx.RawArray('b', max(self._slot_size, 1))
+            for _ in range(self._num_slots)
+        ]
+        self._free_queue = ctx.Queue()
+        for slot in range(self._num_slots):
+            self._free_queue.put(slot)
+        self._ready_queue = ctx.Queue()
+
+        self._views = None
+
+    def __getstate__(self):
+        #
+        # The views are rebuilt in the new process.
+        state = self.__dict__.copy()
+        state['_views'] = None
+        return state
+
+    @property
+    def batch_size(self):
+        return self._batch_size
+
+    @property
+    def num_slots(self):
+        return self._num_slots
+
+    def meta(self):
+        return self._meta
+
+    def views(self, slot):
+        """Get the arrays of a slot.
+
+        Args:
+            slot (int): Slot index.
+
+        Returns:
+            tuple[np.ndarray]: Arrays shaped (batch_size, ...) for each column.
+
+        """
+        if self._views is None:
+            self._views = [
+                tuple(
+                    np.frombuffer(buffer, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+                    for offset, shape, dtype in self._layout
+                )
+                for buffer in self._slots
+            ]
+        return self._views[slot]
+
+    def acquire(self, block=True, timeout=None):
+        """Acquire a free slot to write.
+
+        Returns:
+            int: Slot index.
+
+        Raises:
+            queue.Empty: If no free slot is available.
+
+        """
+        return self._free_queue.get(block=block, timeout=timeout)
+
+    def release(self, slot):
+        """Give the slot back to the buffer after it has been read.
+
+        Args:
+            slot (int): Slot index.
+
+        """
+        self._free_queue.put(slot)
+
+    def write(self, slot, columns):
+        """Write a batch into the slot.
+
+        Args:
+            slot (int): Slot index.
+            columns (tuple|list): Columns of the batch.
+
+        Returns:
+            int: Number of rows written.
+
+        """
+        if len(columns) != len(self._meta):
+            raise ValueError('The batch should have %d columns.' % len(self._meta))
+        size = len(columns[0])
+        if size > self._batch_size:
+            raise ValueError('The batch has %d rows, while the slot can only hold %d.' % (size, self._batch_size))
+        for view, column in zip(self.views(slot), columns):
+            if len(column) != size:
+                raise ValueError('All columns must have the same size.')
+            view[:size] = column
+        return size
+
+    def read(self, slot, size):
+        """Read a batch from the slot.
+
+        Note that the returned arrays are views of the shared memory,
+        they are valid only before the slot is released.
+
+        Args:
+            slot (int): Slot index.
+            size (int): Number of rows.
+
+        Returns:
+            tuple[np.ndarray]: Columns of the batch.
+
+        """
+        return tuple(view[:size] for view in self.views(slot))
+
+    def put(self, columns, tag=None, block=True, timeout=None):
+        """Write a batch into a free slot and make it ready to be got.
+
+        Args:
+            columns (tuple|list): Columns of the batch.
+            tag: Any picklable object sent along with the batch.
+            block (bool): Wait for a free slot.
+            timeout (float): Max time to wait for a free slot.
+
+        Raises:
+            queue.Empty: If no free slot is available.
+
+        """
+        slot = self.acquire(block=block, timeout=timeout)
+        try:
+            size = self.write(slot, columns)
+        except Exception as e:
+            self.release(slot)
+            raise e
+        self._ready_queue.put((slot, size, tag))
+
+    def get(self, block=True, timeout=None):
+        """Get a ready batch.
+        The slot should be released by the caller after the batch is used.
+
+        Returns:
+            tuple: (slot, columns, tag)
+
+        Raises:
+            queue.Empty: If no batch is ready.
+
+        """
+        slot, size, tag = self._ready_queue.get(block=block, timeout=timeout)
+        return slot, self.read(slot, size), tag
+
+
+class ProcessPoolSource(DataSource):
+
+    def __init__(self,
+                 batch_source,
+                 num_workers=4,
+                 buffer_size=16,
+                 shapes=None,
+                 dtypes=None,
+                 num_slots=None):
+        """Data source that maps the batches in multiple worker processes.
+
+        The raw rows are read from the input source of "batch_source" in a loading thread,
+        while the cell mappers and column mappers registered to "batch_source" are applied
+        in the worker processes. Thus CPU-heavy mappers (e.g., image augmentation) are no
+        longer serialized by the GIL.
+        The batches are returned in the same order as "batch_source" gives them, and None
+        is still returned at the end of each epoch.
+
+        If "shapes" and "dtypes" are given, the workers write the batches into a SharedRingBuffer,
+        and the batches are returned as views of the shared memory without copying. In this case,
+        the returned arrays are only valid before the next call of next().
+
+        Args:
+            batch_source (BatchSource): The batch source whose mappers are applied by the workers.
+                Its batch size must be positive.
+            num_workers (int): Number of worker processes.
+            buffer_size (int): Max number of batches waiting to be mapped.
+            shapes (dict[str, tuple]|list[tuple]|tuple[tuple]): Shape of one cell for each column.
+            dtypes (dict[str, Any]|list|tuple): NumPy data type for each column.
+            num_slots (int): Number of slots of the shared memory buffer.
+                Default is 2 * num_workers + 2.
+
+        """
+        if not isinstance(batch_source, BatchSource):
+            raise ValueError('Argument batch_source should be a BatchSource.')
+        if not batch_source.batch_size:
+            raise ValueError('The batch size of batch_source should be positive.')
+        self._batch_source = batch_source
+        if isinstance(num_workers, int) and num_workers > 0:
+            self._num_workers = num_workers
+        else:
+            raise ValueError('Argument num_workers should be a positive integer.')
+        if isinstance(buffer_size, int) and buffer_size > 0:
+            self._buffer_size = buffer_size
+        else:
+            raise ValueError('Argument buffer_size should be a positive integer.')
+
+        if shapes is not None and dtypes is not None:
+            self._ring = SharedRingBuffer(
+                batch_source.meta(),
+                batch_source.batch_size,
+                shapes,
+                dtypes,
+                num_slots if num_slots is not None else 2 * num_workers + 2
+            )
+        elif shapes is None and dtypes is None:
+            self._ring = None
+        else:
+            raise ValueError('Arguments shapes and dtypes should be given together.')
+        self._slot = None
+
+        self._task_queue = None
+        self._result_queue = None
+        self._stop_event = None
+        self._thread = None
+        self._workers = None
+        self._pending = dict()
+        self._next_seq = 0
+        self._closed = False
+
+    @property
+    def num_workers(self):
+        return self._num_workers
+
+    def meta(self):
+        return self._batch_source.meta()
+
+    def next(self):
+        if self._closed:
+            raise RuntimeError('The source has been closed.')
+        if self._workers is None:
+            self._start()
+        if self._slot is not None:
+            self._ring.release(self._slot)
+            self._slot = None
+        seq = self._next_seq
+        while seq not in self._pending:
+            seq_, batch = self._result_queue.get(block=True)
+            self._pending[seq_] = batch
+        batch = self._pending.pop(seq)
+        self._next_seq += 1
+        if isinstance(batch, Exception):
+            raise batch
+        if self._ring is not None and batch is not None:
+            self._slot, size = batch
+            batch = self._ring.read(self._slot, size)
+        return batch
+
+    def _start(self):
+        self._task_queue = multiprocessing.Queue(self._buffer_size)
+        self._result_queue = multiprocessing.Queue()
+        #
+        # The workers must be started before the loading thread,
+        # so that the thread is not duplicated into the forked processes.
+        self._workers = [
+            multiprocessing.Process(
+                target=_process_pool_worker,
+                args=(self._batch_source, self._task_queue, self._result_queue, self._ring, i)
+            )
+            for i in range(self._num_workers)
+        ]
+        for worker in self._workers:
+            worker.daemon = True
+            worker.start()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._load, args=(self._task_queue, self._stop_event))
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def _load(self, task_queue, stop_event):
+        """This method is executed in another thread!
+        """
+        seq = 0
+        while not stop_event.is_set():
+            try:
+                rows = self._batch_source._read_rows()
+            except Exception as e:
+                self._put_task(task_queue, stop_event, (seq, e))
+                break
+            self._put_task(task_queue, stop_event, (seq, rows))
+            seq += 1
+
+    @staticmethod
+    def _put_task(task_queue, stop_event, task):
+        """Put a task into the queue, but give up when the source is closed.
+        """
+        while not stop_event.is_set():
+            try:
+                task_queue.put(task, block=True, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        """Stop the loading thread and the worker processes.
+        The source can not be used after it is closed.
+        """
+        self._closed = True
+        if self._workers is None:
+            return
+        self._stop_event.set()
+        for worker in self._workers:
+            worker.terminate()
+        for worker in self._workers:
+            worker.join()
+        #
+        # Drain the task queue so that the loading thread is not blocked on it.
+        while True:
+            try:
+                self._task_queue.get(block=False)
+            except queue.Empty:
+                break
+        self._thread.join()
+        self._thread = None
+        self._stop_event = None
+        self._task_queue = None
+        self._result_queue = None
+        self._workers = None
+        self._slot = None
+        self._pending = dict()
+        self._next_seq = 0
+
+
+def _process_pool_worker(batch_source, task_queue, result_queue, ring, index):
+    """This function is executed in the worker processes of ProcessPoolSource!
+    """
+    #
+    # Forked workers inherit the random states of the parent.
+    # Reseed them, otherwise the random mappers give the same results in all the workers.
+    seed = (int.from_bytes(os.urandom(4), 'little') + index) % (2 ** 32)
+    random.seed(seed)
+    np.random.seed(seed)
+    while True:
+        #
+        # The slot is acquired BEFORE taking a task.
+        # Since the tasks are taken in order, the worker holding the task that the consumer
+        # is waiting for always has a slot to write, so the pool never deadlocks.
+        slot = ring.acquire() if ring is not None else None
+        seq, rows = task_queue.get(block=True)
+        if rows is None or isinstance(rows, Exception):
+            if slot is not None:
+                ring.release(slot)
+            result_queue.put((seq, rows))
+            continue
+        try:
+            batch = batch_source._map_rows(rows)
+            if slot is not None:
+                batch = (slot, ring.write(slot, batch))
+        except Exception as e:
+            if slot is not None:
+                ring.release(slot)
+            batch = e
+        result_queue.put((seq, batch))
@@ -5,19 +5,185 @@
 @since: 2018-01-13
 """
 
+import concurrent.futures
+import hashlib
+import json
+import mmap
 import os
 import pickle
 import re
 import shutil
+import struct
+import threading
+import zlib
 
 import gridfs
+import numpy as np
 import pymongo
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+COMPRESSIONS = ('zstd', 'lz4', 'zlib')
+QUANTIZATIONS = ('float16', 'int8')
+
+
+def _get_compression(compression):
+    """Return the compression that is actually used.
+    zstd and lz4 fall back to zlib when their packages are not installed.
+    """
+    if compression is None:
+        return None
+    if compression not in COMPRESSIONS:
+        raise ValueError('compression should be one of %s, got %s.' % (str(COMPRESSIONS), compression))
+    if compression == 'zstd' and zstandard is None:
+        return 'zlib'
+    if compression == 'lz4' and lz4_frame is None:
+        return 'zlib'
+    return compression
+
+
+def encode_tensor(value, compression=None, quantization=None):
+    """Encode a tensor into bytes.
+
+    :param value: The tensor (numpy array).
+    :param compression: None, "zstd", "lz4" or "zlib".
+    :param quantization: None, "float16" or "int8". Only floating point tensors are quantized.
+        "int8" uses a symmetric per-tensor scale.
+    :return: (meta, data). "meta" is a JSON serializable dict used to decode the tensor.
+        "data" is a bytes-like object.
+    """
+    compression = _get_compression(compression)
+    if quantization is not None and quantization not in QUANTIZATIONS:
+        raise ValueError('quantization should be one of %s, got %s.' % (str(QUANTIZATIONS), quantization))
+    value = np.asarray(value)
+    if value.dtype.hasobject:
+        raise ValueError('Tensor with an object dtype cannot be encoded.')
+    meta = {
+        'dtype': value.dtype.str,
+        'shape': list(value.shape)
+    }
+
+    if quantization is not None and value.dtype.kind == 'f':
+        #
+        # Tensors that cannot be represented (e.g., out of the float16 range) are kept as they are.
+        max_value = float(np.max(np.abs(value))) if value.size > 0 else 0.0
+        if quantization == 'float16':
+            if max_value <= float(np.finfo(np.float16).max):
+                value = value.astype(np.float16)
+                meta['quantization'] = quantization
+        else:
+            scale = max_value / 127.0
+            if np.isfinite(scale):
+                scale = scale if scale > 0 else 1.0
+                value = np.clip(np.round(value / scale), -127, 127).astype(np.int8)
+                meta['quantization'] = quantization
+                meta['scale'] = scale
+
+    data = np.ascontiguousarray(value).reshape(-1).view(np.uint8)
+    if compression == 'zstd':
+        data = zstandard.ZstdCompressor().compress(data)
+    elif compression == 'lz4':
+        data = lz4_frame.compress(data)
+    elif compression == 'zlib':
+        data = zlib.compress(data)
+    if compression is not None:
+        meta['compression'] = compression
+    return meta, data
+
+
+def decode_tensor(meta, data):
+    """Decode a tensor encoded by encode_tensor().
+    If the tensor is neither compressed nor quantized, the result shares memory with "data".
+
+    :param meta: The meta dict.
+    :param data: A bytes-like object.
+    :return: The tensor (numpy array).
+    """
+    compression = meta.get('compression')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstandard is required to decode this tensor.')
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif compression == 'lz4':
+        if lz4_frame is None:
+            raise RuntimeError('lz4 is required to decode this tensor.')
+        data = lz4_frame.decompress(data)
+    elif compression == 'zlib':
+        data = zlib.decompress(data)
+    elif compression is not None:
+        raise ValueError('Unknown compression %s.' % compression)
+
+    dtype = np.dtype(meta['dtype'])
+    quantization = meta.get('quantization')
+    if quantization == 'float16':
+        value = np.frombuffer(data, dtype=np.float16).astype(dtype)
+    elif quantization == 'int8':
+        value = (np.frombuffer(data, dtype=np.int8) * meta['scale']).astype(dtype)
+    elif quantization is None:
+        value = np.frombuffer(data, dtype=dtype)
+    else:
+        raise ValueError('Unknown quantization %s.' % quantization)
+    return value.reshape(meta['shape'])
+
 
 class ModelDumper(object):
     """ModelDumper
     """
 
+    def __init__(self, compression=None, quantization=None):
+        """Create a dumper.
+
+        :param compression: None, "zstd", "lz4" or "zlib". zstd and lz4 fall back to zlib if not installed.
+        :param quantization: None, "float16" or "int8". Lossy, only applied to floating point tensors.
+        """
+        _get_compression(compression)
+        if quantization is not None and quantization not in QUANTIZATIONS:
+            raise ValueError('quantization should be one of %s, got %s.' % (str(QUANTIZATIONS), quantization))
+        self._compression = compression
+        self._quantization = quantization
+
+    @property
+    def compression(self):
+        return self._compression
+
+    @property
+    def quantization(self):
+        return self._quantization
+
+    _CODEC_KEY = '__codec__'
+
+    def _encode_value(self, value):
+        """Encode a value to be pickled.
+        The value is kept as is if neither compression nor quantization is used.
+        """
+        if self._compression is None and self._quantization is None:
+            return value
+        meta, data = encode_tensor(value, self._compression, self._quantization)
+        return {ModelDumper._CODEC_KEY: meta, 'data': bytes(data)}
+
+    @staticmethod
+    def _decode_value(value):
+        if isinstance(value, dict) and ModelDumper._CODEC_KEY in value:
+            return decode_tensor(value[ModelDumper._CODEC_KEY], value['data'])
+        return value
+
+    def _encode_dict(self, param_dict):
+        if self._compression is None and self._quantization is None:
+            return param_dict
+        return {key: self._encode_value(value) for key, value in param_dict.items()}
+
+    @staticmethod
+    def _decode_dict(param_dict):
+        return {key: ModelDumper._decode_value(value) for key, value in param_dict.items()}
+
     def dump(self, widget, name):
         """Dump the model to somewhere (file, DB, ...) using the given name.
 
@@ -67,20 +233,35 @@ class ModelDumper(object):
         :param path: A string. The path would like to be loaded into the target widget.
         :param strict: Boolean. Strict mode.
         """
-        param_dict = self._load(name)
+        param_dict = self._load_path(name, path)
         if path is not None:
-            new_dict = {}
-            for key, value in param_dict.items():
-                if not key.startswith(path):
-                    continue
-                key, _ = re.subn('^%s' % path, widget.full_name, key)
-                new_dict[key] = value
-            param_dict = new_dict
+            prefix_len = len(path)
+            param_dict = {
+                widget.full_name + key[prefix_len:]: value
+                for key, value in param_dict.items()
+            }
         widget.set_parameters(param_dict, strict)
 
     def _load(self, name):
         raise NotImplementedError
 
+    def _load_path(self, name, path):
+        """Load the parameters whose names start with the given path.
+        Dumpers that are able to read only a part of the stored model should override this method.
+
+        :param name: The model name.
+        :param path: A string or None. None means all the parameters.
+        :return: The parameter dict.
+        """
+        param_dict = self._load(name)
+        if path is None:
+            return param_dict
+        return {
+            key: value
+            for key, value in param_dict.items()
+            if key.startswith(path)
+        }
+
 
 class FileDumper(ModelDumper):
     """File Dumper
@@ -94,16 +275,138 @@ class FileDumper(ModelDumper):
             FileDumper._INSTANCE = FileDumper()
         return FileDumper._INSTANCE
 
-    def __init__(self):
-        super(FileDumper, self).__init__()
+    def __init__(self, compression=None, quantization=None):
+        super(FileDumper, self).__init__(compression, quantization)
+
+    def _dump(self, param_dict, model_file):
+        with open(model_file, 'wb') as f:
+            pickle.dump(self._encode_dict(param_dict), f)
+
+    def _load(self, model_file):
+        with open(model_file, 'rb') as f:
+            return ModelDumper._decode_dict(pickle.load(f))
+
+    def _load_path(self, model_file, path):
+        if ChunkedFileDumper.is_chunked_file(model_file):
+            return ChunkedFileDumper.get_instance()._load_path(model_file, path)
+        return super(FileDumper, self)._load_path(model_file, path)
+
+
+class ChunkedFileDumper(ModelDumper):
+    """Chunked File Dumper
+
+    Dump a model into a single file with the raw tensor bytes followed by an index:
+
+        magic (8 bytes) | padding | tensor_1 | padding | tensor_2 | ... | index (JSON) | index size (uint64)
+
+    The index records the name, dtype, shape, offset and size (and the codec if the tensor is compressed or
+    quantized) of each tensor, and every tensor starts at an offset aligned to 64 bytes.
+    Tensors are encoded and written one by one, so that at most one encoded tensor is held in memory,
+    and the loader maps the file into memory and only touches the tensors that are requested.
+    Files of the previous layout, which put the index in a header before the tensors, can still be loaded.
+    """
+
+    _INSTANCE = None
+
+    MAGIC = b'PHCHUNK2'
+    MAGIC_HEADER = b'PHCHUNK1'
+    ALIGNMENT = 64
+
+    @staticmethod
+    def get_instance():
+        if ChunkedFileDumper._INSTANCE is None:
+            ChunkedFileDumper._INSTANCE = ChunkedFileDumper()
+        return ChunkedFileDumper._INSTANCE
+
+    def __init__(self, compression=None, quantization=None):
+        super(ChunkedFileDumper, self).__init__(compression, quantization)
+
+    @staticmethod
+    def _align(offset):
+        alignment = ChunkedFileDumper.ALIGNMENT
+        return (offset + alignment - 1) // alignment * alignment
 
     def _dump(self, param_dict, model_file):
+        #
+        # write the tensors one by one, and then the index
+        # Without compression and quantization, the encoded data are views of the original arrays.
+        tensors = []
         with open(model_file, 'wb') as f:
-            pickle.dump(param_dict, f)
+            f.write(ChunkedFileDumper.MAGIC)
+            for key, value in param_dict.items():
+                if np.asarray(value).dtype.hasobject:
+                    raise ValueError('Parameter %s has an object dtype which cannot be dumped.' % key)
+                meta, data = encode_tensor(value, self._compression, self._quantization)
+                offset = ChunkedFileDumper._align(f.tell())
+                f.write(b'\0' * (offset - f.tell()))
+                f.write(data)
+                tensor = {'name': key}
+                tensor.update(meta)
+                tensor['offset'] = offset
+                tensor['size'] = len(data)
+                tensors.append(tensor)
+            index = json.dumps({'tensors': tensors}).encode('utf-8')
+            f.write(index)
+            f.write(struct.pack('<Q', len(index)))
+
+    @staticmethod
+    def is_chunked_file(model_file):
+        """Check if the given file is in the chunked format.
+
+        :param model_file: The model file.
+        :return: True or False.
+        """
+        with open(model_file, 'rb') as f:
+            magic = f.read(len(ChunkedFileDumper.MAGIC))
+        return magic in (ChunkedFileDumper.MAGIC, ChunkedFileDumper.MAGIC_HEADER)
+
+    @staticmethod
+    def read_header(model_file):
+        """Read the index of a chunked model file.
+
+        :param model_file: The model file.
+        :return: A list of dicts with the keys "name", "dtype", "shape", "offset" and "size",
+            and also "compression", "quantization" and "scale" if they are used.
+        """
+        with open(model_file, 'rb') as f:
+            return ChunkedFileDumper._read_header(f)
+
+    @staticmethod
+    def _read_header(f):
+        magic = f.read(len(ChunkedFileDumper.MAGIC))
+        if magic == ChunkedFileDumper.MAGIC:
+            f.seek(-8, os.SEEK_END)
+            index_size, = struct.unpack('<Q', f.read(8))
+            f.seek(-8 - index_size, os.SEEK_END)
+            index = json.loads(f.read(index_size).decode('utf-8'))
+        elif magic == ChunkedFileDumper.MAGIC_HEADER:
+            header_size, = struct.unpack('<Q', f.read(8))
+            index = json.loads(f.read(header_size).decode('utf-8'))
+        else:
+            raise ValueError('%s is not a chunked model file.' % f.name)
+        return index['tensors']
 
     def _load(self, model_file):
+        return self._load_path(model_file, None)
+
+    def _load_path(self, model_file, path):
         with open(model_file, 'rb') as f:
-            return pickle.load(f)
+            tensors = ChunkedFileDumper._read_header(f)
+            if path is not None:
+                tensors = [tensor for tensor in tensors if tensor['name'].startswith(path)]
+            if len(tensors) == 0:
+                return {}
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        #
+        # Tensors that are neither compressed nor quantized are read-only views of the mapped file.
+        # The mapping is released when all of them are garbage collected.
+        view = memoryview(buffer)
+        param_dict = {}
+        for tensor in tensors:
+            offset = tensor['offset']
+            data = view[offset:offset + tensor['size']]
+            param_dict[tensor['name']] = decode_tensor(tensor, data)
+        return param_dict
 
 
 class TreeDumper(ModelDumper):
@@ -115,6 +418,10 @@ class TreeDumper(ModelDumper):
     ....h1/
     ........w.0
     ........b.0
+    MANIFEST.json
+
+    The parameter files are written and read by a thread pool. MANIFEST.json lists the parameter names and
+    files, so loading does not need to walk the tree.
     """
 
     _INSTANCE = None
@@ -125,32 +432,67 @@ class TreeDumper(ModelDumper):
             TreeDumper._INSTANCE = TreeDumper()
         return TreeDumper._INSTANCE
 
-    def __init__(self, output_dir=None):
-        super(TreeDumper, self).__init__()
+    MANIFEST = 'MANIFEST.json'
+
+    def __init__(self, output_dir=None, compression=None, quantization=None, num_workers=8):
+        super(TreeDumper, self).__init__(compression, quantization)
         self._output_dir = output_dir
+        self._num_workers = num_workers
+
+    def _get_model_dir(self, name):
+        #
+        # Normalized, so that the ".tmp" and ".old" dirs are siblings of the model dir even if the name ends with "/".
+        if self._output_dir is not None:
+            name = os.path.join(self._output_dir, name)
+        return os.path.normpath(name)
 
     def _dump(self, param_dict, name):
         #
-        # prepare model dir
-        if self._output_dir is None:
-            model_dir = name
-        else:
-            model_dir = os.path.join(self._output_dir, name)
-        if os.path.exists(model_dir):
-            shutil.rmtree(model_dir)
-        os.mkdir(model_dir)
+        # prepare a temporary model dir
+        # The tree is written to "<model_dir>.tmp" and then renamed, so the model dir is never half written.
+        model_dir = self._get_model_dir(name)
+        temp_dir = model_dir + '.tmp'
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
+        os.mkdir(temp_dir)
 
         #
-        #  start to dump
-        for path, value in param_dict.items():
+        # start to dump
+        manifest = []
+        param_dirs = set()
+        for path in param_dict:
             param_dir, _ = os.path.split(path)
-            param_dir = os.path.join(model_dir, param_dir)
-            param_file = os.path.join(model_dir, path)
-            param_file = TreeDumper._escape(param_file)
+            param_dirs.add(param_dir)
+            manifest.append({'name': path, 'file': TreeDumper._escape(path)})
+        for param_dir in sorted(param_dirs):
+            param_dir = os.path.join(temp_dir, param_dir)
             if not os.path.exists(param_dir):
                 os.makedirs(param_dir)
-            with open(param_file, 'wb') as f:
-                pickle.dump(value, f)
+        with concurrent.futures.ThreadPoolExecutor(self._num_workers) as executor:
+            futures = [
+                executor.submit(self._dump_value, os.path.join(temp_dir, item['file']), param_dict[item['name']])
+                for item in manifest
+            ]
+            for future in futures:
+                future.result()
+        with open(os.path.join(temp_dir, TreeDumper.MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+
+        #
+        # replace the old model dir
+        # A directory cannot be replaced atomically, so the old one is moved away first.
+        old_dir = model_dir + '.old'
+        if os.path.exists(old_dir):
+            shutil.rmtree(old_dir)
+        if os.path.exists(model_dir):
+            os.rename(model_dir, old_dir)
+        os.rename(temp_dir, model_dir)
+        if os.path.exists(old_dir):
+            shutil.rmtree(old_dir)
+
+    def _dump_value(self, param_file, value):
+        with open(param_file, 'wb') as f:
+            pickle.dump(self._encode_value(value), f)
 
     @staticmethod
     def _escape(path):
@@ -164,34 +506,70 @@ class TreeDumper(ModelDumper):
         return ''.join(path)
 
     def _load(self, name):
+        return self._load_path(name, None)
+
+    def _load_path(self, name, path):
         #
         # prepare model dir
-        if self._output_dir is None:
-            model_dir = name
-        else:
-            model_dir = os.path.join(self._output_dir, name)
+        # If the dumping was interrupted between the two renames, the old model dir is still complete.
+        model_dir = self._get_model_dir(name)
         if not os.path.exists(model_dir):
-            raise FileNotFoundError()
+            model_dir = model_dir + '.old'
+            if not os.path.exists(model_dir):
+                raise FileNotFoundError()
+
+        #
+        # find the parameter files
+        manifest_file = os.path.join(model_dir, TreeDumper.MANIFEST)
+        if os.path.exists(manifest_file):
+            with open(manifest_file, 'r') as f:
+                manifest = json.load(f)
+            if path is not None:
+                manifest = [item for item in manifest if item['name'].startswith(path)]
+        else:
+            #
+            # a tree dumped without manifest
+            # Start from the deepest directory of the path, so that only the matched subtree is visited.
+            manifest = []
+            if path is None:
+                base_dir = ''
+            else:
+                base_dir, _ = os.path.split(path)
+                if not os.path.isdir(os.path.join(model_dir, base_dir)):
+                    return {}
+            for subpath in os.listdir(os.path.join(model_dir, base_dir)):
+                subpath = os.path.join(base_dir, subpath)
+                TreeDumper._load_tree(model_dir, subpath, manifest, path)
 
         #
         # load
-        param_dict = {}
-        for path in os.listdir(model_dir):
-            TreeDumper._load_tree(model_dir, path, param_dict)
-        return param_dict
+        with concurrent.futures.ThreadPoolExecutor(self._num_workers) as executor:
+            values = executor.map(
+                lambda item: TreeDumper._load_value(os.path.join(model_dir, item['file'])),
+                manifest
+            )
+            return {item['name']: value for item, value in zip(manifest, values)}
+
+    @staticmethod
+    def _load_value(param_file):
+        with open(param_file, 'rb') as f:
+            value = pickle.load(f)
+        return ModelDumper._decode_value(value)
 
     @staticmethod
-    def _load_tree(model_dir, path, param_dict):
+    def _load_tree(model_dir, path, manifest, prefix=None):
         real_path = os.path.join(model_dir, path)
         if os.path.isdir(real_path):
+            if prefix is not None and not (path.startswith(prefix) or prefix.startswith(path + os.sep)):
+                return
             for subpath in os.listdir(real_path):
                 subpath = os.path.join(path, subpath)
-                TreeDumper._load_tree(model_dir, subpath, param_dict)
+                TreeDumper._load_tree(model_dir, subpath, manifest, prefix)
         elif os.path.isfile(real_path):
-            path = TreeDumper._unescape(path)
-            with open(real_path, 'rb') as f:
-                value = pickle.load(f)
-                param_dict[path] = value
+            name = TreeDumper._unescape(path)
+            if prefix is not None and not name.startswith(prefix):
+                return
+            manifest.append({'name': name, 'file': path})
 
     @staticmethod
     def _unescape(path):
@@ -207,45 +585,393 @@ class TreeDumper(ModelDumper):
 
 class MongoDumper(ModelDumper):
     """MongoDB Model Dumper
+
+    Each tensor is stored as a GridFS file, and a manifest document maps the tensor names to the files:
+
+        {_id: name, tensors: [{name, file_id, hash, dtype, shape, ...}, ...], ...}
+
+    Tensors are uploaded and downloaded in parallel threads. A dump only uploads the tensors whose content hash
+    differs from the last dump of the same name, and the manifest is replaced after all the uploads finish, so a
+    reader never sees a partially written model. Models dumped as a single pickled file by the older versions can
+    still be loaded.
     """
 
-    def __init__(self, host, db_name, coll='models'):
+    def __init__(self,
+                 host,
+                 db_name,
+                 coll='models',
+                 compression=None,
+                 quantization=None,
+                 num_workers=8):
         self._host = host
         self._db_name = db_name
         self._coll = coll
-        super(MongoDumper, self).__init__()
+        self._num_workers = num_workers
+        super(MongoDumper, self).__init__(compression, quantization)
+
+        self._lock = threading.Lock()
+        self._client = None
+        self._executor = None
+
+    def _get_db(self):
+        """Get the database from the client shared by all the threads of this dumper.
+        MongoClient maintains its own connection pool and is thread safe.
+        """
+        with self._lock:
+            if self._client is None:
+                self._client = pymongo.MongoClient(self._host, maxPoolSize=max(self._num_workers, 10))
+            return self._client[self._db_name]
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(self._num_workers)
+            return self._executor
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _get_fs(self):
+        return gridfs.GridFS(self._get_db(), collection=self._coll)
+
+    def _get_manifests(self):
+        return self._get_db()[self._coll + '.manifests']
 
     def clear(self):
-        with pymongo.MongoClient(self._host) as conn:
-            db = conn[self._db_name]
-            coll1 = db[self._coll + '.files']
-            coll2 = db[self._coll + '.chunks']
-            coll1.remove()
-            coll2.remove()
+        db = self._get_db()
+        db[self._coll + '.files'].delete_many({})
+        db[self._coll + '.chunks'].delete_many({})
+        db[self._coll + '.manifests'].delete_many({})
+
+    def delete(self, name):
+        """Delete a dumped model.
+
+        :param name: The model name.
+        """
+        fs = self._get_fs()
+        manifest = self._get_manifests().find_one_and_delete({'_id': name})
+        if manifest is not None:
+            file_ids = [tensor['file_id'] for tensor in manifest['tensors']]
+            list(self._get_executor().map(fs.delete, file_ids))
+        if fs.exists(name):
+            fs.delete(name)
+
+    @staticmethod
+    def _hash(value, compression, quantization):
+        value = np.ascontiguousarray(value)
+        h = hashlib.sha1()
+        h.update(('%s|%s|%s|%s|' % (value.dtype.str, value.shape, compression, quantization)).encode('utf-8'))
+        h.update(value.reshape(-1).view(np.uint8))
+        return h.hexdigest()
+
+    def _put_tensor(self, fs, file_id, value):
+        meta, data = encode_tensor(value, self._compression, self._quantization)
+        if fs.exists(file_id):
+            fs.delete(file_id)
+        fs.put(bytes(data), _id=file_id)
+        return meta
 
     def _dump(self, param_dict, name, **kwargs):
-        with pymongo.MongoClient(self._host) as conn:
-            db = conn[self._db_name]
-            fs = gridfs.GridFS(db, collection=self._coll)
-            if fs.exists(name):
-                fs.delete(name)
-            with fs.new_file(_id=name, **kwargs) as f:
-                pickle.dump(param_dict, f)
+        fs = self._get_fs()
+        manifests = self._get_manifests()
+        old_manifest = manifests.find_one({'_id': name})
+        old_tensors = {}
+        if old_manifest is not None:
+            old_tensors = {tensor['name']: tensor for tensor in old_manifest['tensors']}
+
+        #
+        # upload the changed tensors
+        executor = self._get_executor()
+        tensors = []
+        futures = []
+        for key, value in param_dict.items():
+            value = np.asarray(value)
+            content_hash = MongoDumper._hash(value, self._compression, self._quantization)
+            old_tensor = old_tensors.get(key)
+            if old_tensor is not None and old_tensor['hash'] == content_hash:
+                tensors.append(old_tensor)
+                continue
+            tensor = {
+                'name': key,
+                'file_id': '%s/%s/%s' % (name, key, content_hash),
+                'hash': content_hash
+            }
+            tensors.append(tensor)
+            futures.append((tensor, executor.submit(self._put_tensor, fs, tensor['file_id'], value)))
+        try:
+            for tensor, future in futures:
+                tensor.update(future.result())
+        except Exception:
+            #
+            # Cancel the uploads that have not started, and wait for the running ones to finish.
+            # Otherwise the files written after the cleanup are left in GridFS.
+            for _, future in futures:
+                future.cancel()
+            concurrent.futures.wait([future for _, future in futures])
+            for tensor, future in futures:
+                if not future.cancelled() and future.exception() is None:
+                    fs.delete(tensor['file_id'])
+            raise
+
+        #
+        # replace the manifest and remove the files that are no longer used
+        manifest = dict(kwargs)
+        manifest['_id'] = name
+        manifest['tensors'] = tensors
+        manifests.replace_one({'_id': name}, manifest, upsert=True)
+        file_ids = {tensor['file_id'] for tensor in tensors}
+        expired = [
+            tensor['file_id']
+            for tensor in old_tensors.values()
+            if tensor['file_id'] not in file_ids
+        ]
+        list(executor.map(fs.delete, expired))
+        if fs.exists(name):
+            fs.delete(name)
+
+    def _get_tensor(self, fs, tensor):
+        with fs.get(tensor['file_id']) as f:
+            data = f.read()
+        return decode_tensor(tensor, data)
 
     def _load(self, name):
-        with pymongo.MongoClient(self._host) as conn:
-            db = conn[self._db_name]
-            fs = gridfs.GridFS(db, collection=self._coll)
+        try:
+            return self._load_path(name, None)
+        except FileNotFoundError:
+            return None
+
+    def _load_path(self, name, path):
+        fs = self._get_fs()
+        manifest = self._get_manifests().find_one({'_id': name})
+        if manifest is None:
+            #
+            # a model dumped as a single file
             f = fs.find_one({'_id': name})
             if f is None:
-                return None
+                raise FileNotFoundError('Model %s does not exist.' % name)
             with f:
                 param_dict = pickle.load(f)
-        return param_dict
+            param_dict = ModelDumper._decode_dict(param_dict)
+            if path is not None:
+                param_dict = {key: value for key, value in param_dict.items() if key.startswith(path)}
+            return param_dict
+
+        tensors = manifest['tensors']
+        if path is not None:
+            tensors = [tensor for tensor in tensors if tensor['name'].startswith(path)]
+        executor = self._get_executor()
+        values = executor.map(lambda tensor: self._get_tensor(fs, tensor), tensors)
+        return {tensor['name']: value for tensor, value in zip(tensors, values)}
+
+
+class CheckpointManager(object):
+    """Asynchronous checkpoint manager.
 
+    save() only takes a snapshot of the parameters (one session run). The snapshot is serialized and written
+    in a background thread, first to a temporary name and then renamed, so a checkpoint on the disk is always
+    complete. Only the latest "max_to_keep" checkpoints are kept.
 
-def dump_model_as_file(widget, model_file):
-    FileDumper.get_instance().dump(widget, model_file)
+    If a new snapshot is taken while the previous one is still waiting to be written, the older one is dropped.
+    The training loop is never blocked by the disk.
+    """
+
+    def __init__(self,
+                 widget,
+                 output_dir,
+                 dumper=None,
+                 max_to_keep=5,
+                 prefix='checkpoint'):
+        """Create a checkpoint manager.
+
+        :param widget: The widget (or Trainable) to save.
+        :param output_dir: The directory to save the checkpoints.
+        :param dumper: A ModelDumper whose names are paths, e.g., ChunkedFileDumper (default), FileDumper or
+            TreeDumper without output_dir.
+        :param max_to_keep: Max number of checkpoints to keep. None means keeping all of them.
+        :param prefix: The prefix of the checkpoint names.
+        """
+        if max_to_keep is not None and max_to_keep < 1:
+            raise ValueError('max_to_keep should be positive.')
+        self._widget = widget
+        self._output_dir = output_dir
+        self._dumper = dumper if dumper is not None else ChunkedFileDumper.get_instance()
+        self._max_to_keep = max_to_keep
+        self._prefix = prefix
+
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self._checkpoints = self._scan()
+        self._step = self._checkpoints[-1][0] + 1 if len(self._checkpoints) > 0 else 0
+
+        self._cond = threading.Condition()
+        self._pending = None
+        self._writing = False
+        self._closed = False
+        self._error = None
+        self._num_dropped = 0
+        self._thread = None
+
+    def _scan(self):
+        pattern = re.compile('^%s-(\\d+)$' % re.escape(self._prefix))
+        checkpoints = []
+        for name in os.listdir(self._output_dir):
+            match = pattern.match(name)
+            if match is not None:
+                checkpoints.append((int(match.group(1)), os.path.join(self._output_dir, name)))
+        checkpoints.sort()
+        return checkpoints
+
+    @property
+    def checkpoints(self):
+        """Paths of the completed checkpoints, from the oldest to the latest.
+        """
+        with self._cond:
+            return [path for _, path in self._checkpoints]
+
+    @property
+    def latest(self):
+        with self._cond:
+            return self._checkpoints[-1][1] if len(self._checkpoints) > 0 else None
+
+    @property
+    def num_dropped(self):
+        return self._num_dropped
+
+    def save(self, step=None):
+        """Take a snapshot of the parameters and write it in the background.
+
+        :param step: The step number used to name the checkpoint. Default is the last step plus one.
+        :return: The path of the checkpoint.
+        """
+        self._raise_error()
+        if self._closed:
+            raise RuntimeError('The checkpoint manager has been closed.')
+        if step is None:
+            step = self._step
+        self._step = step + 1
+
+        #
+        # The fetched arrays may share memory with the variables, so they are copied before the next train step.
+        param_dict = {
+            key: np.array(value)
+            for key, value in self._widget.get_parameters().items()
+        }
+        path = os.path.join(self._output_dir, '%s-%d' % (self._prefix, step))
+        with self._cond:
+            if self._pending is not None:
+                self._num_dropped += 1
+            self._pending = (step, path, param_dict)
+            self._cond.notify_all()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_loop, daemon=True)
+                self._thread.start()
+        return path
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                step, path, param_dict = self._pending
+                self._pending = None
+                self._writing = True
+            try:
+                self._write(step, path, param_dict)
+            except Exception as e:
+                self._error = e
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+
+    def _write(self, step, path, param_dict):
+        temp_path = path + '.tmp'
+        CheckpointManager._remove(temp_path)
+        self._dumper._dump(param_dict, temp_path)
+        CheckpointManager._remove(path)
+        os.replace(temp_path, path)
+
+        with self._cond:
+            self._checkpoints = [item for item in self._checkpoints if item[0] != step]
+            self._checkpoints.append((step, path))
+            self._checkpoints.sort()
+            expired = []
+            if self._max_to_keep is not None and len(self._checkpoints) > self._max_to_keep:
+                expired = self._checkpoints[:-self._max_to_keep]
+                self._checkpoints = self._checkpoints[-self._max_to_keep:]
+        for _, expired_path in expired:
+            CheckpointManager._remove(expired_path)
+
+    @staticmethod
+    def _remove(path):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def _raise_error(self):
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise error
+
+    def wait(self):
+        """Block until all the snapshots taken have been written.
+        """
+        with self._cond:
+            while self._pending is not None or self._writing:
+                self._cond.wait()
+        self._raise_error()
+
+    def close(self):
+        """Write the remaining snapshot and stop the background thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+    def restore(self, checkpoint=None, strict=True):
+        """Load a checkpoint into the widget.
+
+        :param checkpoint: Path of the checkpoint. Default is the latest one.
+        :param strict: Boolean. Strict mode.
+        """
+        if checkpoint is None:
+            checkpoint = self.latest
+            if checkpoint is None:
+                raise FileNotFoundError('No checkpoint in %s.' % self._output_dir)
+        self._dumper.load(self._widget, checkpoint, strict=strict)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def dump_model_as_file(widget, model_file, compression=None, quantization=None):
+    if compression is None and quantization is None:
+        FileDumper.get_instance().dump(widget, model_file)
+    else:
+        FileDumper(compression, quantization).dump(widget, model_file)
 
 
 def load_model_from_file(widget,
@@ -253,12 +979,41 @@ def load_model_from_file(widget,
                          path=None,
                          strict=True):
     """Load parameters into a model (or a part of the model) using FileDumper.
+    If the file is in the chunked format, only the tensors under the given path are read.
     """
     FileDumper.get_instance().load(widget, model_file, path, strict)
 
 
-def dump_model_as_tree(widget, name):
-    TreeDumper.get_instance().dump(widget, name)
+def dump_model_as_chunked_file(widget, model_file, compression=None, quantization=None):
+    if compression is None and quantization is None:
+        ChunkedFileDumper.get_instance().dump(widget, model_file)
+    else:
+        ChunkedFileDumper(compression, quantization).dump(widget, model_file)
+
+
+def load_model_from_chunked_file(widget,
+                                 model_file,
+                                 path=None,
+                                 strict=True):
+    """Load parameters into a model (or a part of the model) using ChunkedFileDumper.
+    Only the tensors under the given path are read from the file.
+    """
+    ChunkedFileDumper.get_instance().load(widget, model_file, path, strict)
+
+
+def convert_file_to_chunked(model_file, output_file):
+    """Convert a pickled model file (dumped by FileDumper) into the chunked format.
+    The converted file can still be loaded by load_model_from_file().
+    """
+    param_dict = FileDumper.get_instance()._load(model_file)
+    ChunkedFileDumper.get_instance()._dump(param_dict, output_file)
+
+
+def dump_model_as_tree(widget, name, compression=None, quantization=None):
+    if compression is None and quantization is None:
+        TreeDumper.get_instance().dump(widget, name)
+    else:
+        TreeDumper(compression=compression, quantization=quantization).dump(widget, name)
 
 
 def load_model_from_tree(widget,
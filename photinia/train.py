@@ -9,8 +9,11 @@ import collections
 import datetime as dt
 
 import numpy as np
+import tensorflow as tf
 
 from . import ops
+from .core import training
+from .core import widgets
 
 
 class AccCalculator(object):
@@ -219,3 +222,161 @@ class GradientClipping(OptimizerWrapper):
     @property
     def grad_norm(self):
         return self._grad_norm
+
+
+class AccumulatingOptimizer(OptimizerWrapper):
+    """AccumulatingOptimizer
+    """
+
+    def __init__(self, optimizer):
+        """Accumulate the gradients over several micro-batches and apply their average at once.
+
+        The gradients are summed into accumulator variables by the operation returned by minimize(),
+        which is usually used as the updates of a slot fed with micro-batches.
+        Then, apply() applies the averaged gradients and resets the accumulators. It does nothing if
+        no gradient has been accumulated.
+        The accumulators are local variables, which are initialized by "initialize_global_variables()"
+        but are not dumped with the model parameters.
+
+        To clip the gradients, wrap the GradientClipping instead of the TF optimizer, e.g.,
+        AccumulatingOptimizer(GradientClipping(optimizer, max_norm)). The clipping is then applied to
+        the averaged gradients.
+
+        Args:
+            optimizer: The TF optimizer, or an OptimizerWrapper which processes the averaged gradients.
+
+        """
+        if isinstance(optimizer, OptimizerWrapper):
+            self._wrapper = optimizer
+            optimizer = optimizer.optimizer
+        else:
+            self._wrapper = None
+        super(AccumulatingOptimizer, self).__init__(optimizer)
+        self._acc_list = None
+        self._count = None
+        self._accumulate_op = None
+        self._apply_op = None
+        self._reset_op = None
+        self._step_apply = None
+        self._step_reset = None
+
+    def minimize(self, loss, var_list=None):
+        """Build the operations to accumulate and apply the gradients.
+
+        Args:
+            loss: The loss tensor.
+            var_list (list[tf.Variable]|tuple[tf.Variable]): Variables to be trained.
+
+        Returns:
+            tf.Operation: The operation that accumulates the gradients of one micro-batch.
+
+        """
+        if self._accumulate_op is not None:
+            raise RuntimeError('The accumulating optimizer can only minimize one loss.')
+        pair_list = self._optimizer.compute_gradients(loss, var_list=var_list)
+        pair_list = [(grad, var) for grad, var in pair_list if grad is not None]
+
+        #
+        # The accumulators are local variables under the name scope of the optimizer,
+        # so they are neither trained nor dumped with the model parameters.
+        with tf.name_scope(self._optimizer.get_name()):
+            self._acc_list = [
+                widgets.variable(
+                    name='grad_acc',
+                    initial_value=tf.zeros(var.shape, dtype=var.dtype.base_dtype),
+                    trainable=False,
+                    dtype=var.dtype.base_dtype,
+                    collections=[tf.GraphKeys.LOCAL_VARIABLES]
+                )
+                for _, var in pair_list
+            ]
+            self._count = widgets.variable(
+                name='grad_count',
+                initial_value=0.0,
+                trainable=False,
+                dtype=tf.float32,
+                collections=[tf.GraphKeys.LOCAL_VARIABLES]
+            )
+
+        #
+        # accumulate
+        # Note that the sparse gradients (IndexedSlices) are converted into dense tensors.
+        self._accumulate_op = tf.group(
+            *[
+                tf.assign_add(acc, tf.convert_to_tensor(grad))
+                for acc, (grad, _) in zip(self._acc_list, pair_list)
+            ],
+            tf.assign_add(self._count, 1.0)
+        )
+
+        #
+        # reset
+        self._reset_op = tf.group(
+            *[tf.assign(acc, tf.zeros_like(acc)) for acc in self._acc_list],
+            tf.assign(self._count, 0.0)
+        )
+
+        #
+        # apply
+        # Nothing is applied if no gradient has been accumulated,
+        # otherwise the optimizer would still update its slots and states with zero gradients.
+        def _apply():
+            avg_pair_list = [
+                (acc / tf.cast(self._count, acc.dtype.base_dtype), var)
+                for acc, (_, var) in zip(self._acc_list, pair_list)
+            ]
+            if self._wrapper is not None:
+                avg_pair_list = self._wrapper._process_gradients(avg_pair_list)
+            apply_op = self._optimizer.apply_gradients(avg_pair_list)
+            with tf.control_dependencies([apply_op]):
+                return tf.group(
+                    *[tf.assign(acc, tf.zeros_like(acc)) for acc in self._acc_list],
+                    tf.assign(self._count, 0.0)
+                )
+
+        self._apply_op = tf.cond(self._count > 0.0, _apply, tf.no_op, name='apply')
+
+        self._step_apply = training.Step(updates=self._apply_op)
+        self._step_reset = training.Step(updates=self._reset_op)
+        return self._accumulate_op
+
+    @property
+    def wrapper(self):
+        return self._wrapper
+
+    @property
+    def accumulate_op(self):
+        return self._accumulate_op
+
+    @property
+    def apply_op(self):
+        """The operation that applies the averaged gradients and then resets the accumulators.
+        """
+        return self._apply_op
+
+    @property
+    def reset_op(self):
+        return self._reset_op
+
+    @property
+    def step_apply(self):
+        return self._step_apply
+
+    @property
+    def step_reset(self):
+        return self._step_reset
+
+    def apply(self):
+        """Apply the averaged gradients and reset the accumulators.
+        """
+        self._step_apply()
+
+    def reset(self):
+        """Drop the accumulated gradients.
+        """
+        self._step_reset()
+
+    def _process_gradients(self, pair_list):
+        if self._wrapper is not None:
+            return self._wrapper._process_gradients(pair_list)
+        return pair_list